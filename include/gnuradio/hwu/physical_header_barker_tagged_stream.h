@@ -15,9 +15,11 @@ namespace gr {
   namespace hwu {
 
     /*!
-     * \brief <+description of block+>
+     * \brief Adds a barker code physical layer header and optional tail to each tagged packet
      * \ingroup hwu
      *
+     * The header can be emitted as several back to back repetitions of the
+     * barker code, giving the receivers timing recovery a longer preamble to lock on.
      */
     class HWU_API physical_header_barker_tagged_stream : virtual public gr::tagged_stream_block
     {
@@ -32,7 +34,10 @@ namespace gr {
        * class. hwu::physical_header_barker_tagged_stream::make is the public interface for
        * creating new instances.
        */
-      static sptr make(int barker_len, bool add_tail, const std::string& lengthtagname);
+      static sptr make(int barker_len,
+                       bool add_tail,
+                       const std::string& lengthtagname,
+                       int preamble_repeats = 1);
     };
 
   } // namespace hwu
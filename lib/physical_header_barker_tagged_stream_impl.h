@@ -19,7 +19,9 @@ namespace gr {
     {
      private:
      bool add_tail;
-     std::vector<uint8_t> barker;
+     std::vector<uint8_t> header; // Barker code repeated preamble_repeats times, built once in the constructor
+     std::vector<uint8_t> tail;   // Single barker code, empty if add_tail is false
+     std::vector<tag_t> tags;     // Reused across work() calls to avoid reallocating
      const std::unordered_map<int, std::vector<uint8_t>> BARKER_CODES={
         {2, {2}},      //[1,0]
         {3, {6}},      //[1,1,0]
@@ -30,15 +32,13 @@ namespace gr {
         {13, {31,53}}  //[1,1,1,1,1,0,0,1,1,0,1,0,1]
         };
 
-      // Nothing to declare in this block.
-
      protected:
       int calculate_output_stream_length(const gr_vector_int &ninput_items);
 
      public:
       
 
-      physical_header_barker_tagged_stream_impl(int barker_len, bool add_tail, const std::string& lengthtagname);
+      physical_header_barker_tagged_stream_impl(int barker_len, bool add_tail, const std::string& lengthtagname, int preamble_repeats);
       ~physical_header_barker_tagged_stream_impl();
 
       // Where all the action really happens
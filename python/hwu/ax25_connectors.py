@@ -20,9 +20,12 @@
 #
 
 import time
+import logging
 import threading
-import bitstring as bs
+import itertools
+import functools
 import pmt
+from .ax25_constants import S_FRAMES
 
 """ Class to split up- and downlink and put them in separate threads"""
 class Uplinker:
@@ -35,6 +38,10 @@ class Uplinker:
         self._lock = threading.Lock()
         self.transceiver = transceiver
         self.framer = framer
+        self.framing_lock = threading.Lock() # Held from popping a request until its frame is built, so go-back-N recovery never sees a half-advanced V(S)
+        self.flow_control_lock = threading.Lock()
+        self.key_ups = 0
+        self.frames_keyed = 0
 
 
     def start(self) -> None:
@@ -46,68 +53,247 @@ class Uplinker:
                 if not self._running.is_set():
                     self._running.set()
         except Exception as e:
-            self.transceiver.logger.warning(f"Could not start uplinker thread due to {e}")
+            self.transceiver.logger.warning("Could not start uplinker thread due to %s", e)
 
     """ Uplinker Main Run Loop """
     def _run(self) -> None:
         
         while not self._kill.isSet():
 
-            self.transceiver.lock.acquire()
-            if self.transceiver.framequeue:
+            if self.transceiver.full_duplex:
+                self.__send_next_frame()
+            else:
+                self.__send_burst()
+
+
+    """ Full duplex operation, frames are sent one at a time as they are queued """
+    def __send_next_frame(self) -> None:
+
+        with self.transceiver.framequeue_not_empty:
+            if not self.transceiver.framequeue:
+                self.transceiver.framequeue_not_empty.wait(timeout=0.1)
+            if not self.transceiver.framequeue:
+                return
+
+        window_full = False
+        link_down = False
+        with self.framing_lock:
+            with self.transceiver.tx_lock:
+                if not self.transceiver.framequeue:
+                    return
                 start_time = time.time()
                 request = self.transceiver.framequeue.pop(0)
-                self.transceiver.lock.release()
-
-                # Check whether receive window would be exceeded 
-                if request["Type"] == 'I' and self.transceiver.get_state_variable('vs') == (self.transceiver.get_state_variable('va') + self.transceiver.receive_window_k)%self.transceiver.modulo: #TODO Check if this interferes with recovery by blocking frames fomr sending
-                    with self.transceiver.lock:
-                        self.transceiver.framequeue.insert(0, request)
-                    self.transceiver.logger.debug(f"Remote receive window full, waiting for clear. Acked: {self.transceiver.get_state_variable('va')}, Sent: {self.transceiver.get_state_variable('vs')}") # Framequeue at {len(self.transceiver.framequeue)}")
-                    time.sleep(0.1) #TODO rework waiting procedure
+
+            # I frames wait for link setup. S and U frames are queued in front of them, so nothing else is held up
+            if request["Type"] == 'I' and not self.transceiver.get_link_up():
+                self.transceiver.queue_frame(request, 0)
+                link_down = True
+            # Check whether receive window would be exceeded, or the remote asked to hold back I frames
+            elif request["Type"] == 'I' and (self.transceiver.get_remote_busy() or self.transceiver.get_state_variable('vs') == (self.transceiver.get_state_variable('va') + self.transceiver.receive_window_k)%self.transceiver.modulo): #TODO Check if this interferes with recovery by blocking frames fomr sending
+                self.transceiver.queue_frame(request, 0)
+                window_full = True
+            else:
+                raw_frame = self.__build_frame(request)
+                self.transceiver.metrics.observe('framing', time.time() - start_time)
+
+        if link_down:
+            self.__wait_for_window()
+            return
+
+        if window_full:
+            self.transceiver.logger.debug("Remote receive window full, waiting for clear. Acked: %d, Sent: %d", self.transceiver.get_state_variable('va'), self.transceiver.get_state_variable('vs'))
+            self.stage_queued_payloads() # Use the wait to prepare the frames that go out once the window opens
+            self.__wait_for_window()
+            return
+            
+        if raw_frame is None:
+            self.transceiver.logger.debug("Framing failed!")
+            return
+
+        if request.get("Trace") is not None: # Stamped first, the acknowledgement may be handled before send returns
+            self.transceiver.tracer.sent([request["Trace"]], time.time())
+        self.send(raw_frame) # No pacing, the link is full duplex so there is no turnaround to wait for
+        if request["Type"] == 'I':
+            self.transceiver.timer_reset_t1.set()
+
+
+    """ 
+    Half duplex operation, every key-up of the transmitter is used for a burst of up to k frames.
+    Poll is set on the last I frame of the burst, then the channel is left to the remote until it answers with Final
+    """
+    def __send_burst(self) -> None:
+
+        start_time = time.time()
+
+        with self.framing_lock:
+            burst = self.__collect_burst()
+
+            """ Poll on the last I frame, so the remote answers right after the burst """
+            last_i_frame = max((position for position, request in enumerate(burst) if request["Type"] == 'I'), default=None)
+            if last_i_frame is not None:
+                burst[last_i_frame] = dict(burst[last_i_frame], Poll=True)
+
+            raw_frames = []
+            for request in burst:
+                framing_start = time.time()
+                raw_frame = self.__build_frame(request)
+                self.transceiver.metrics.observe('framing', time.time() - framing_start)
+                if raw_frame is None:
+                    self.transceiver.logger.debug("Framing failed!")
                     continue
+                raw_frames.append(raw_frame)
+
+        if not burst:
+            with self.transceiver.framequeue_not_empty:
+                window_blocked = bool(self.transceiver.framequeue)
+                if not window_blocked:
+                    self.transceiver.framequeue_not_empty.wait(timeout=0.1)
+            if window_blocked:
+                self.transceiver.logger.debug("Remote receive window full, waiting for clear. Acked: %d, Sent: %d", self.transceiver.get_state_variable('va'), self.transceiver.get_state_variable('vs'))
+                self.stage_queued_payloads() # Use the wait to prepare the frames that go out once the window opens
+                self.__wait_for_window()
+            return
+
+        if not raw_frames:
+            return
+
+        if last_i_frame is not None:
+            self.transceiver.set_awaiting_final(True)
+
+        traces = [request["Trace"] for request in burst if request.get("Trace") is not None]
+        if traces:
+            self.transceiver.tracer.sent(traces, time.time())
+        self.send(b"".join(raw_frames))
+        self.key_ups += 1
+        self.frames_keyed += len(raw_frames)
+        self.transceiver.metrics.observe('burst', time.time() - start_time)
+
+        if last_i_frame is not None:
+            self.transceiver.timer_reset_t1.set()
+            self.__wait_for_final()
+
+
+    """ Pops the frames for the next burst, all queued S and U frames and as many I frames as the remote receive window allows """
+    def __collect_burst(self) -> list:
+
+        burst = []
+        outstanding = (self.transceiver.get_state_variable('vs') - self.transceiver.get_state_variable('va'))%self.transceiver.modulo
+        window_left = 0 if self.transceiver.get_remote_busy() or not self.transceiver.get_link_up() else self.transceiver.receive_window_k - outstanding
+
+        with self.transceiver.tx_lock:
+            while self.transceiver.framequeue and len(burst) < self.transceiver.receive_window_k:
+                if self.transceiver.framequeue[0]["Type"] == 'I':
+                    if window_left <= 0:
+                        break
+                    window_left -= 1
+                burst.append(self.transceiver.framequeue.pop(0))
+
+        return burst
 
-                else:
-                    raw_frame = self.framer.frame(
-                                            request["Type"], #Frametype
-                                            self.transceiver.src_addr,
-                                            self.transceiver.src_ssid,
-                                            request["Dest"][0], #destination address
-                                            request["Dest"][1], #destination ssid
-                                            self.transceiver.pid,
-                                            request["Payload"], #Payload data
-                                            request["Com"],
-                                            self.transceiver.modulo,
-                                            request["Poll"] #Poll/Final
-                                            )
-                    
-                    if raw_frame is None:
-                        self.transceiver.logger.debug("Framing failed!")
-                        continue
-
-                    self.send(raw_frame)
-                    send_time = time.time() - start_time 
-                    self.transceiver.timing_logger.debug("Sending " + request["Type"] + f" frame took {send_time*1000:.2f}ms")
-                    time.sleep(0.01)
-                    if request["Type"] == 'I':
-                        self.transceiver.timer_reset_t1.set()
-                        
-            else: #framequeue empty
-                self.transceiver.lock.release()
-                time.sleep(0.01)            
-                continue    
-
-
-    def send(self, frame:bs.BitArray):
-
-        byte_vector = [byte for byte in frame.tobytes()] #this does add 0 bits to the end as padding, should be removed later in flowgraph. Although not strictly necessary
+
+    """ Sleeps until an acknowledgement may have opened the remote receive window, at most 100 ms """
+    def __wait_for_window(self) -> None:
+
+        with self.transceiver.framequeue_not_empty:
+            self.transceiver.framequeue_not_empty.wait(timeout=0.1)
+
+
+    """ Leaves the channel to the remote until the Final response to our Poll arrives, at most for the duration of T1 """
+    def __wait_for_final(self) -> None:
+
+        deadline = time.time() + self.transceiver.timers.timer_t1_seconds
+        while self.transceiver.get_awaiting_final() and time.time() < deadline and not self._kill.is_set():
+            time.sleep(0.005)
+        self.transceiver.set_awaiting_final(False)
+
+
+    """ Builds the frame for a request from the framequeue """
+    def __build_frame(self, request:dict):
+
+        if request["Type"] == 'I' and request.get("Frame") is None and len(request["Payload"]) > self.transceiver.information_field_length: # Queued before XID negotiated a smaller N1
+            self.transceiver.logger.warning("Payload of %d bytes dropped, the link allows %d (N1)", len(request["Payload"]), self.transceiver.information_field_length)
+            self.transceiver.metrics.count('payloads_dropped')
+            if self.transceiver.release_tx_queued(len(request["Payload"])):
+                self.send_flow_control()
+            return None
+
+        if request["Type"] == 'I' or request["Type"] in S_FRAMES: # Frame carries current N(R), any delayed acknowledgement is piggybacked on it
+            self.transceiver.clear_ack_pending()
+
+        metrics = self.transceiver.metrics
+        metrics.count(f"sent_{request['Type']}")
+        if request["Poll"] and request["Com"] == 'COM':
+            metrics.count('polls_sent')
+
+        if request.get("Frame") is not None: # Retransmission from backlog, only control field and FCS need updating
+            metrics.count('retransmissions')
+            return self.framer.reframe(request["Frame"], request["Poll"], request.get("PayloadCRC"))
+
+        if request["Type"] == 'I' and self.transceiver.release_tx_queued(len(request["Payload"])): # Payload leaves the queue for the backlog
+            self.send_flow_control()
+
+        return self.framer.frame(
+                                request["Type"], #Frametype
+                                self.transceiver.src_addr,
+                                self.transceiver.src_ssid,
+                                request["Dest"][0], #destination address
+                                request["Dest"][1], #destination ssid
+                                self.transceiver.pid,
+                                request["Payload"], #Payload data
+                                request["Com"],
+                                self.transceiver.modulo,
+                                request["Poll"], #Poll/Final
+                                request.get("PayloadCRC"), #Precomputed payload checksum, if any
+                                request.get("Staged"), #Prestuffed payload, if any
+                                request.get("Trace") #Latency trace, if tracing
+                                )
+
+
+    """ Average number of frames sent per transmitter key-up in half duplex operation """
+    def get_frames_per_key_up(self) -> float:
+        return self.frames_keyed / self.key_ups if self.key_ups else 0.0
+
+
+    """ Stuff and mirror the payloads of the next k queued I frames ahead of time, so they go out with minimal delay once acknowledged """
+    def stage_queued_payloads(self) -> None:
+
+        with self.transceiver.tx_lock:
+            pending = list(itertools.islice((request for request in self.transceiver.framequeue if request["Type"] == 'I' and request.get("Frame") is None),
+                                            self.transceiver.receive_window_k))
+
+        for request in pending:
+            if "Staged" in request:
+                continue
+            if request.get("PayloadCRC") is None:
+                request["PayloadCRC"] = self.framer.calc_checksum(request["Payload"])
+            request["Staged"] = self.framer.stage_payload(self.transceiver.pid, request["Payload"])
+
+
+    def send(self, frame:bytes):
+
+        #Framer pads the last byte with 0 bits, should be removed later in flowgraph. Although not strictly necessary
         try:  
-            self.transceiver.gr_block.message_port_pub(pmt.intern('Frame out'), pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(byte_vector), byte_vector)))
+            self.transceiver.gr_block.message_port_pub(pmt.intern('Frame out'), pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(frame), list(frame)))) # The bindings take a sequence of ints, list() converts in C
         except Exception as e:
-            self.transceiver.logger.warning(f"exception occured when trying to send frame: {e}")
+            self.transceiver.logger.warning("exception occured when trying to send frame: %s", e)
 
 
 
+    """
+    Tells the producer on Payload in whether more payloads are welcome, see tx_high_watermark.
+    Pause and resume are decided on different threads, so the state is read when publishing, the last message sent is always the current one
+    """
+    def send_flow_control(self):
+
+        with self.flow_control_lock:
+            ready = self.transceiver.get_tx_ready()
+            self.transceiver.logger.debug("%s producer, %d payload bytes queued", 'Resuming' if ready else 'Pausing', self.transceiver.get_tx_queued())
+            try:
+                self.transceiver.gr_block.message_port_pub(pmt.intern('Flow control'), pmt.cons(pmt.intern('tx_ready'), pmt.from_bool(ready)))
+            except Exception as e:
+                self.transceiver.logger.warning("exception occured when trying to send flow control: %s", e)
+
+
 
 """ Class to split up- and downlink and put them in separate threads"""
 class Downlinker:
@@ -119,17 +305,71 @@ class Downlinker:
         self._lock = threading.Lock()
         self.transceiver = transceiver
         self.framer = framer
-        
-        self.setup_handlers()
-
-    """ Setup dict of handler functions to call depending on frame type """
-    def setup_handlers(self):
-        self.handler_functions = {}
-        for attr in dir(self):
-            if attr.endswith("handler"):
-                self.handler_functions.setdefault(attr[13:-14], getattr(self, attr))
-        
-    
+        self.transition_stats = {} # (link state, frame type): [count, total seconds, max seconds]
+
+        self.setup_transitions()
+
+    """
+    Setup the (link state, frame type) transition table, see LINK_STATES. Each transition runs as one critical
+    section on the transceiver state lock and returns the follow up actions, e.g. queueing a response or
+    retransmitting, which are run once the lock is released
+    """
+    def setup_transitions(self):
+        connected = {'I': self.__I_frame_transition,
+                     'RECOVERY': self.__sequence_error_transition,
+                     'RR': self.__RR_frame_transition,
+                     'RNR': self.__RNR_frame_transition,
+                     'REJ': self.__REJ_frame_transition,
+                     'SREJ': self.__SREJ_frame_transition,
+                     'SABM': self.__link_reset_transition,
+                     'SABME': self.__link_reset_transition,
+                     'DISC': self.__remote_disconnect_transition,
+                     'DM': self.__link_lost_transition,
+                     'UA': self.__ignore_transition,
+                     'ERROR': self.__ERROR_frame_transition}
+        # Waiting for the Final to our T1 poll, supervisory frames with P set answer it
+        timer_recovery = dict(connected,
+                              RR=self.__RR_timer_recovery_transition,
+                              RNR=self.__RNR_timer_recovery_transition,
+                              REJ=self.__REJ_timer_recovery_transition)
+        numbered = ('I', 'RECOVERY', 'RR', 'RNR', 'REJ', 'SREJ')
+        disconnected = {frametype: self.__disconnected_transition for frametype in numbered}
+        disconnected.update(SABM=self.__link_reset_transition,
+                            SABME=self.__link_reset_transition,
+                            DISC=self.__disconnected_transition,
+                            DM=self.__ignore_transition,
+                            UA=self.__ignore_transition,
+                            ERROR=self.__ERROR_frame_transition)
+        # SABM sent. A crossing SABM from the remote is answered, the link comes up with the UA to ours
+        awaiting_connection = {frametype: self.__ignore_transition for frametype in numbered}
+        awaiting_connection.update(SABM=self.__link_setup_collision_transition,
+                                   SABME=self.__link_setup_collision_transition,
+                                   DISC=self.__disconnected_transition,
+                                   DM=self.__link_refused_transition,
+                                   UA=self.__link_established_transition,
+                                   ERROR=self.__ERROR_frame_transition)
+        # DISC sent
+        awaiting_release = {frametype: self.__disconnected_transition for frametype in numbered}
+        awaiting_release.update(SABM=self.__disconnected_transition,
+                                SABME=self.__disconnected_transition,
+                                DISC=self.__release_collision_transition,
+                                DM=self.__link_released_transition,
+                                UA=self.__link_released_transition,
+                                ERROR=self.__ERROR_frame_transition)
+
+        self.transitions = {}
+        for state, row in (('DISC', disconnected),
+                           ('AWAITING_CONNECTION', awaiting_connection),
+                           ('AWAITING_RELEASE', awaiting_release),
+                           ('CONNECTED', connected),
+                           ('BUSY', connected),
+                           ('TIMER_RECOVERY', timer_recovery)):
+            for frametype, transition in row.items():
+                self.transitions[(state, frametype)] = transition
+            self.transitions[(state, 'XID')] = self.__XID_transition
+            self.transitions[(state, 'TEST')] = self.__TEST_transition
+
+
     """ Start Downlinker Thread"""
     def start(self) -> None:
          
@@ -140,234 +380,396 @@ class Downlinker:
                 if not self._running.is_set():
                     self._running.set()
         except Exception as e:
-            self.transceiver.logger.warning(f"Could not start downlinker thread, due to {e}")
+            self.transceiver.logger.warning("Could not start downlinker thread, due to %s", e)
         
         
     """ Downlinker Main Run loop"""
     def _run(self) -> None:
 
-
-
         while not self._kill.isSet():
-            self.transceiver.lock.acquire()
-            if not self.transceiver.frame_input_queue:
-                self.transceiver.lock.release()
-                time.sleep(0.01) # TODO: Rework waiting for frame procedure
-                continue
+            with self.transceiver.frame_input_queue_not_empty:
+                if not self.transceiver.frame_input_queue:
+                    self.transceiver.frame_input_queue_not_empty.wait(timeout=0.1)
+                if not self.transceiver.frame_input_queue:
+                    continue
+                msg_pmt = self.transceiver.frame_input_queue.pop(0)
             try:
                 start_time = time.time()
-                raw_frame = bs.BitArray(bytes(pmt.u8vector_elements(pmt.cdr(self.transceiver.frame_input_queue.pop(0)))))
-                self.transceiver.lock.release()
+                raw_frame = bytes(pmt.u8vector_elements(pmt.cdr(msg_pmt)))
             except Exception as e:
-                self.transceiver.lock.release()
-                self.transceiver.logger.warning(f"The following exception occured while receiving frame: {e}")
+                self.transceiver.logger.warning("The following exception occured while receiving frame: %s", e)
 
                 continue
             
+            if not raw_frame: # Back to back flags, e.g. between the frames of a half duplex burst
+                continue
+
+            if self.transceiver.monitor:
+                self.__monitor(raw_frame, start_time)
+
+            if self.transceiver.digipeat: # Repeated straight from the received bytes, also in half duplex the radio keys up for it on its own
+                try:
+                    repeated = self.framer.digipeat(raw_frame, self.transceiver.digipeater_keys)
+                except Exception as e:
+                    self.transceiver.logger.warning("The following error occured while digipeating: %s", e)
+                    repeated = None
+                if repeated is not None:
+                    self.transceiver.uplinker.send(repeated)
+                    self.transceiver.metrics.count('digipeated')
+                    self.transceiver.metrics.observe('digipeat', time.time() - start_time)
+                    continue
+
+            if self.transceiver.monitor and raw_frame[:6] != self.transceiver.own_address_key[:6]: # Not for us, no need to deframe
+                continue
+
             try:
+                deframing_start = time.time()
                 data = self.framer.deframe(raw_frame)
-                self.transceiver.logger.debug(f"Raw Frame received: {raw_frame.hex}, Decoded Frame: {data}")
+                self.transceiver.metrics.observe('deframing', time.time() - deframing_start)
+                if self.transceiver.logger.isEnabledFor(logging.DEBUG): # Hex dump of every frame, only built when it is written
+                    self.transceiver.logger.debug("Raw Frame received: %s, Decoded Frame: %s", raw_frame.hex(), data)
             except Exception as e:
-                self.transceiver.logger.warning(f"The following error occured while deframing: {e}")
+                self.transceiver.logger.warning("The following error occured while deframing: %s", e)
                 continue
 
-            try:
-                self.handler_functions[data['Type']](data)
-                self.transceiver.timing_logger.debug(f"Answering to {data['Type']} frame took {(time.time() - start_time)*1000:.2f}ms")
-            except:
-                self.transceiver.logger.warning(f"No correspondig handler for frame type {data['Type']}")
-    
-
-    def __ERROR_frame_handler(self, data):
-                self.transceiver.logger.warning("=========== Internal Error occured, see last log entry ===========")
-                self.transceiver.logger.warning("")
-
-    def __I_frame_handler(self, data):
-        if data["Poll"]: #Respond correctly to Poll typ
-            poll_state = True
-        else:
-            poll_state = False
-
-            self.__acknowledgement_handler(data)
+            if data['Type'] == 'UI': # Connectionless, delivered without touching the link state
+                self.__deliver(data["Pid-Data"][1:], 'UI out')
+                self.transceiver.metrics.count('received_UI')
+                self.transceiver.metrics.observe('handler', time.time() - start_time)
+                continue
 
-        byte_vec = [byte for byte in data["Pid-Data"][8:].tobytes()]
+            self.dispatch(data, start_time)
+
+
+    """
+    Runs the transition for the current link state and the received frame type, then its follow up actions.
+    @return: False if there is no transition for the frame in this state or it failed
+    """
+    def dispatch(self, data, start_time=None):
+
+        start_time = time.time() if start_time is None else start_time
+        self.transceiver.metrics.count(f"received_{data['Type']}")
+        if data['Poll'] and data['Com'] == 'COM':
+            self.transceiver.metrics.count('polls_received')
+        with self.transceiver.lock:
+            if self.transceiver.pass_start is None: # First signal since the link was down
+                self.transceiver.pass_start = start_time
+                self.transceiver.pass_acked = False
+            state = self.transceiver.get_state()
+            transition = self.transitions.get((state, data['Type']))
+            if transition is None:
+                self.transceiver.logger.warning("No transition for %s frame in state %s, frame dropped", data['Type'], state)
+                return False
+            try:
+                actions = transition(data)
+            except Exception as e:
+                self.transceiver.logger.warning("%s frame transition in state %s failed: %r", data['Type'], state, e)
+                return False
 
+        for action in actions:
+            try:
+                action()
+            except Exception as e:
+                self.transceiver.logger.warning("Action %s after %s frame in state %s failed: %r", action, data['Type'], state, e)
+
+        elapsed = time.time() - start_time
+        stats = self.transition_stats.setdefault((state, data['Type']), [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        self.transceiver.metrics.observe('handler', elapsed)
+        return True
+
+    """
+    Handler latency per transition, from taking the frame off the input queue until all follow up actions ran.
+    @return: dict of (link state, frame type): (count, mean seconds, max seconds)
+    """
+    def get_transition_stats(self):
+        return {key: (count, total/count, maximum) for key, (count, total, maximum) in list(self.transition_stats.items())}
+
+
+    """ Transitions. Called with the transceiver state lock held, return the actions to run after it is released """
+
+    def __ERROR_frame_transition(self, data):
+        self.transceiver.logger.warning("=========== Internal Error occured, see last log entry ===========")
+        self.transceiver.logger.warning("")
+        return []
+
+    def __ignore_transition(self, data):
+        self.transceiver.logger.debug("%s frame ignored in state %s", data['Type'], self.transceiver.state)
+        return []
+
+    """ Frames of a link we don't have. The remote learns from DM, and if we have traffic waiting the link is set up right away """
+    def __disconnected_transition(self, data):
+        self.transceiver.logger.debug("%s frame received while disconnected", data['Type'])
+        actions = []
+        if data["Poll"] or data["Type"] == 'DISC': # Commands with P set are answered with DM, F set
+            actions.append(functools.partial(self.transceiver.queue_frame, self.__response_request('DM', data["Poll"], 'RES'), 0))
+        if self.transceiver.state == 'DISC' and data["Type"] != 'DISC':
+            actions.append(functools.partial(self.transceiver.connect, only_if_pending=True))
+        return actions
+
+    """ SABM, the remote (re)starts the link. Sequence numbers start over on both ends once it gets our UA """
+    def __link_reset_transition(self, data):
+        self.transceiver.logger.debug("%s received, link %s", data['Type'], 'reset' if self.transceiver.state != 'DISC' else 'established')
+        return [functools.partial(self.transceiver.reset_link, self.__response_request('UA', data["Poll"], 'RES'))]
+
+    def __link_setup_collision_transition(self, data):
+        self.transceiver.logger.debug("%s received while connecting, answering", data['Type'])
+        return [functools.partial(self.transceiver.queue_frame, self.__response_request('UA', data["Poll"], 'RES'), 0)]
+
+    def __link_established_transition(self, data):
+        self.transceiver.logger.debug("UA received, link established")
+        return [self.transceiver.reset_link]
+
+    def __link_refused_transition(self, data):
+        if not data["Poll"]: # Not the answer to our SABM, but to a frame sent before
+            self.transceiver.logger.debug("DM without F received while connecting, ignored")
+            return []
+        if self.transceiver.xid_pending: # Answer to the XID ahead of the SABM, the link runs on our own parameters
+            self.transceiver.xid_pending = False
+            self.transceiver.logger.debug("Remote does not support XID")
+            return []
+        self.transceiver.logger.warning("Link setup refused by remote with DM")
+        self.transceiver.set_disconnected()
+        self.transceiver.timer_cancel_t1.set()
+        return []
+
+    """ The remote has no link, e.g. after a restart. The link is set up again at once if there is traffic left """
+    def __link_lost_transition(self, data):
+        self.transceiver.logger.warning("DM received while connected, link lost")
+        self.transceiver.set_disconnected()
+        return [functools.partial(self.transceiver.connect, only_if_pending=True)]
+
+    def __remote_disconnect_transition(self, data):
+        self.transceiver.logger.debug("DISC received, link released by remote")
+        self.transceiver.set_disconnected()
+        return [functools.partial(self.transceiver.queue_frame, self.__response_request('UA', data["Poll"], 'RES'), 0)]
+
+    def __release_collision_transition(self, data):
+        return [functools.partial(self.transceiver.queue_frame, self.__response_request('UA', data["Poll"], 'RES'), 0)]
+
+    """ XID parameter negotiation. A command is answered with the parameters both ends support, both ends apply them """
+    def __XID_transition(self, data):
+        trx = self.transceiver
         try:
-            self.transceiver.logger.debug(f"Successfully received Data: {byte_vec}")
-            self.transceiver.gr_block.message_port_pub(pmt.intern("Payload out"), pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(byte_vec), byte_vec)))
-        except Exception as e:
-            self.logger.warning(f"Exception occured during payload out: {e}")
-
-        if self.transceiver.get_remote_busy():
-            self.transceiver.timer_reset_t3.set()
-
-        # Update internal state variables
-        self.transceiver.set_state_variable("vr", (self.transceiver.get_state_variable("vr") + 1)%self.transceiver.modulo)
-
-        # Check if all lost frames have been recovered
-        if self.transceiver.get_rej_active() and data["Ns"] == self.transceiver.get_ns_before_seqbreak()-1 and self.transceiver.rej == "REJ":
-            self.transceiver.set_rej_active(0)
-            self.transceiver.logger.debug("REJ Recovery finished, all missing frames received")
-
-        # Add supervisory frame response if needed (No I-frames in frame queue, remote receive window full)
-        if not self.transceiver.framequeue or self.transceiver.get_state_variable('vs') == (self.transceiver.get_state_variable('va') + self.transceiver.receive_window_k)%self.transceiver.modulo:
-            busy_state = self.transceiver.get_state() == 'BUSY'
-            with self.transceiver.lock:
-                self.transceiver.framequeue.insert(0,
-                                                    {"Dest":[self.transceiver.dest_addr,
-                                                            self.transceiver.dest_ssid],
-                                                            "Type":'RNR' if busy_state else 'RR',
-                                                            "Poll":poll_state,
-                                                            "Payload": None,
-                                                            "Com": 'COM'})
-    
-    def __RECOVERY_frame_handler(self, data):
- 
-        if not self.transceiver.get_rej_active():
-            self.transceiver.logger.debug(f"Sequence Error occured, now in {self.transceiver.rej} recovery!")
+            remote = self.framer.parse_xid_info(data["Pid-Data"])
+        except ValueError as e:
+            trx.logger.warning("XID frame ignored: %s", e)
+            return []
+
+        negotiated = trx.apply_xid_parameters(remote)
+        if data["Com"] == 'RES':
+            trx.xid_pending = False
+            return []
+        return [functools.partial(trx.queue_frame, {"Dest":[trx.dest_addr, trx.dest_ssid], "Type":'XID', "Poll":data["Poll"], "Payload": self.framer.build_xid_info(negotiated), "Com":'RES'}, 0)]
+
+    """ TEST commands are echoed in any link state, responses are echoes of our link probe """
+    def __TEST_transition(self, data):
+        if data["Com"] == 'RES':
+            return [functools.partial(self.transceiver.probe.handle_echo, data["Pid-Data"], time.time())]
+        return [functools.partial(self.transceiver.queue_frame, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'TEST', "Poll":data["Poll"], "Payload": data["Pid-Data"], "Com":'RES'}, 0)]
+
+    def __link_released_transition(self, data):
+        self.transceiver.logger.debug("%s received, link released", data['Type'])
+        self.transceiver.set_disconnected()
+        self.transceiver.timer_cancel_t1.set()
+        return []
+
+    def __I_frame_transition(self, data):
+        trx = self.transceiver
+        actions = self.__acknowledge(data["Nr"])
+
+        payload = data["Pid-Data"][1:] # Strip PID
+        actions.append(functools.partial(self.__deliver, payload))
+
+        # Downstream is not keeping up with Payload out, tell the remote to hold back I frames right away
+        became_busy = trx.add_rx_buffered(len(payload))
+        if became_busy:
+            trx.logger.debug("Receive buffer at %d bytes, entering BUSY", trx.rx_buffered)
+
+        if trx.remote_busy:
+            trx.timer_reset_t3.set()
+
+        trx.state_variables['vr'] = (trx.state_variables['vr'] + 1)%trx.modulo
+
+        if trx.rej_active: # Any in sequence frame is the one asked for, a later gap needs a new REJ
+            trx.rej_active = 0
+            trx.logger.debug("REJ Recovery finished, requested frame received")
+
+        # Acknowledge. Polls and a full receive window are answered at once, otherwise N(R) is piggybacked
+        # on the next outgoing frame, or sent as a single RR covering all frames received when T2 expires.
+        # In full duplex there is no turnaround to save, so RR goes out at once unless an I frame can carry N(R) now
+        if trx.full_duplex:
+            ack_now = data["Poll"] or not trx.framequeue or trx.state_variables['vs'] == (trx.state_variables['va'] + trx.receive_window_k)%trx.modulo
         else:
-            self.transceiver.logger.debug(f"Still in {self.transceiver.rej} recovery!")
-
-        if self.transceiver.get_rej_active() and data["Poll"]: #Anser to Poll while already in reject mode. Needed for recovery of a lost REJ frame, expected when Timer T1 runs out
-            with self.transceiver.lock:
-                self.transceiver.framequeue.insert(0, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'REJ', "Poll":True, "Payload": None, "Com": 'COM'})
-
-        if self.transceiver.rej == "REJ":
-            if not self.transceiver.get_rej_active(): # Don't resend REJ frame if already happend, or it will mess up the procedure
-                self.transceiver.set_ns_before_seqbreak(data["Ns"])
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(0, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'REJ', "Poll":data["Poll"], "Payload": None, "Com":'COM'})
-                self.transceiver.set_rej_active(1)
-
-            return None
-    
-        elif self.transceiver.rej == "SREJ":
-            self.transceiver.logger.warning("SREJ type error handling not implemented yet!")
-            return
-        
-        # Should never get here
-        self.transceiver.logger.warning("Error in the recovery setup, neither REJ nor SREJ properly setup! Reverting to REJ as default!")
-        self.transceiver.rej = "REJ"
-        return None
-    
-    def __REJ_frame_handler(self, data):
-
-        self.__acknowledgement_handler(data)
-
-        self.transceiver.set_remote_busy(False)
-
-        sendstate_at_rej = self.transceiver.get_state_variable('vs')
-        self.transceiver.set_state_variable('vs', data["Nr"])
-        self.transceiver.logger.debug(f"Offset, transceiver at: {sendstate_at_rej}, remote expected: {data['Nr']}")
-
-        for iters in range((sendstate_at_rej - data["Nr"])%self.transceiver.modulo):
-            with self.transceiver.lock:
-                self.transceiver.framequeue.insert(iters, self.transceiver.frame_backlog[(data["Nr"]+iters)%self.transceiver.modulo])
-            self.transceiver.logger.debug(f"Added frame from backlog pos {(data['Nr']+iters)%self.transceiver.modulo} to framequeue at pos {iters}")
-
-        return None
-    
-    def __SREJ_frame_handler(self, data):
-
-
-        return None
-    
-    def __RR_frame_handler(self, data):
-        
-        self.transceiver.set_remote_busy(False)
-
-        self.__acknowledgement_handler(data)
-                                                
-        if data["Poll"] == True and self.transceiver.get_t1_try_count() == 0: #Answer to Poll coming from remote
-            self.transceiver.logger.debug("Poll frame received, answering")
-
-            self.transceiver.set_ns_before_seqbreak(self.transceiver.get_state_variable("vr")) #Assume sequence break. Needed for REJ handling
-            self.transceiver.set_rej_active(1)
-
-            if self.transceiver.get_state() == 'BUSY':
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(0, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'RNR', "Poll":True, "Payload": None, "Com": 'RES'})
-                return
-            else:
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(0, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'RR', "Poll":True, "Payload": None, "Com": 'RES'})
-                return
-            
-        
-        elif data["Poll"] == True and self.transceiver.get_t1_try_count() != 0: # final response to poll, act accrordingly
-
-            self.transceiver.logger.debug("Final frame received, answering")
-            self.transceiver.set_t1_try_count(0)
-            if self.transceiver.get_state_variable("va") == self.transceiver.get_state_variable("vs"): # No lost frames
-                return
-            
-            #Actual missing frames, retransmit. Same procedure as in __REJ_frame_handler
-            sendstate_at_rej = self.transceiver.get_state_variable('vs')
-            self.transceiver.set_state_variable('vs', data["Nr"])
-            self.transceiver.logger.debug(f"Offset, transceiver at: {sendstate_at_rej}, remote expected: {data['Nr']}")
-                
-            for iters in range((sendstate_at_rej - data["Nr"])%self.transceiver.modulo):
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(iters, self.transceiver.frame_backlog[(data["Nr"]+iters)%self.transceiver.modulo])
-                self.transceiver.logger.debug(f"Added frame from backlog pos {(data['Nr']+iters)%self.transceiver.modulo} to framequeue at pos {iters}")
-                    
-
-        return
-        
-
-    
-    def __RNR_frame_handler(self, data): #TODO T3 start/stop
-
-        self.transceiver.set_remote_busy(True)
-
-        self.__acknowledgement_handler(data)                           
-
-        if data["Poll"] == True and self.transceiver.get_t1_try_count() == 0: #Answer to Poll coming from remote
-            if self.transceiver.get_state() == 'BUSY':
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(0, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'RNR', "Poll":True, "Payload": None, "Com": 'RES'})
-                return
-            else:
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(0, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'RR', "Poll":True, "Payload": None, "Com": 'RES'})
-                return
-            
-        
-        elif data["Poll"] == True and self.transceiver.get_t1_try_count() != 0: # final response to poll, act accrordingly
-            
-            self.transceiver.set_t1_try_count(0)
-            if self.transceiver.get_state_variable("va") == self.transceiver.get_state_variable("vs"): # No lost frames
+            ack_now = data["Poll"]
+        ack_now = ack_now or became_busy
+        if not ack_now and trx.set_ack_pending() < trx.receive_window_k:
+            trx.timer_start_t2.set()
+        else:
+            actions.append(functools.partial(trx.queue_frame, self.__response_request(None, data["Poll"], 'COM'), 0))
+        return actions
+
+    def __sequence_error_transition(self, data):
+        trx = self.transceiver
+        actions = self.__acknowledge(data["Nr"]) # N(R) is valid on out of sequence frames too
+
+        if trx.rej == "SREJ":
+            trx.logger.warning("SREJ type error handling not implemented yet!")
+            return actions
+        if trx.rej != "REJ": # Should never get here
+            trx.logger.warning("Error in the recovery setup, neither REJ nor SREJ properly setup! Reverting to REJ as default!")
+            trx.rej = "REJ"
+
+        if trx.rej_active:
+            trx.logger.debug("Still in REJ recovery!")
+            if data["Poll"]: # Answer to Poll while already in reject mode. Needed for recovery of a lost REJ frame, expected when Timer T1 runs out
+                actions.append(functools.partial(trx.queue_frame, self.__response_request('REJ', True, 'COM'), 0))
+            return actions
+
+        trx.logger.debug("Sequence Error occured, now in REJ recovery!")
+        trx.ns_before_seqbreak = data["Ns"]
+        trx.rej_active = 1 # Don't resend REJ frame until the requested frame arrived, or it will mess up the procedure
+        actions.append(functools.partial(trx.queue_frame, self.__response_request('REJ', data["Poll"], 'COM'), 0))
+        return actions
+
+    def __REJ_frame_transition(self, data):
+        actions = self.__set_remote_busy(False) + self.__acknowledge(data["Nr"])
+        if data["Poll"]: # Remote answered our Poll with a reject, channel is ours again
+            self.transceiver.awaiting_final = False
+        actions.append(functools.partial(self.__retransmit_from, data["Nr"]))
+        return actions
+
+    def __REJ_timer_recovery_transition(self, data):
+        if data["Poll"]: # Final to our T1 poll, the retransmission follows from the REJ itself
+            self.__leave_timer_recovery()
+        return self.__REJ_frame_transition(data)
+
+    def __SREJ_frame_transition(self, data):
+        self.transceiver.logger.debug("SREJ frame received, selective reject not implemented yet")
+        return []
+
+    def __RR_frame_transition(self, data):
+        return self.__supervisory_transition(data, remote_busy=False)
+
+    def __RNR_frame_transition(self, data):
+        return self.__supervisory_transition(data, remote_busy=True)
+
+    def __RR_timer_recovery_transition(self, data):
+        return self.__supervisory_timer_recovery_transition(data, remote_busy=False)
+
+    def __RNR_timer_recovery_transition(self, data):
+        return self.__supervisory_timer_recovery_transition(data, remote_busy=True)
+
+    """ RR and RNR while connected. P set is a poll from the remote, unless it closes our half duplex burst """
+    def __supervisory_transition(self, data, remote_busy):
+        actions = self.__set_remote_busy(remote_busy) + self.__acknowledge(data["Nr"])
+
+        if not data["Poll"]:
+            return actions
+        if self.transceiver.awaiting_final:
+            return actions + self.__final_received(data)
+
+        self.transceiver.logger.debug("Poll frame received, answering")
+        actions.append(functools.partial(self.transceiver.queue_frame, self.__response_request(None, True, 'RES'), 0))
+        return actions
+
+    """ RR and RNR while waiting for the Final to our T1 poll """
+    def __supervisory_timer_recovery_transition(self, data, remote_busy):
+        actions = self.__set_remote_busy(remote_busy) + self.__acknowledge(data["Nr"])
+        if data["Poll"]:
+            self.__leave_timer_recovery()
+            actions += self.__final_received(data)
+        return actions
+
+    def __leave_timer_recovery(self):
+        self.transceiver.state = 'CONNECTED'
+        self.transceiver.t1_try_count = 0
+
+    """ Final response to our Poll, anything sent but not acknowledged by it is lost and sent again """
+    def __final_received(self, data):
+        trx = self.transceiver
+        trx.awaiting_final = False
+        trx.logger.debug("Final frame received, answering")
+        if trx.state_variables['va'] == trx.state_variables['vs']: # No lost frames
+            trx.timer_cancel_t1.set()
+            return []
+        return [functools.partial(self.__retransmit_from, data["Nr"])]
+
+    def __set_remote_busy(self, busy:bool):
+        self.transceiver.remote_busy = busy
+        return [] if busy else [self.transceiver.wake_uplinker] # I frames may have been held back for the remote
+
+    """ Takes N(R) as the new V(A), handles T1 accordingly """
+    def __acknowledge(self, nr):
+        trx = self.transceiver
+
+        if nr == trx.state_variables['va']: return [] # No new frames have been acknolwedged, nothin to do
+
+        if nr == trx.state_variables['vs']: #All sent frames are acknowledged, stop timer t1
+            trx.timer_cancel_t1.set()
+        else: #Some new frames have been acknowledged, but not all, reset timer t1
+            trx.timer_reset_t1.set()
+
+        # Backlog entries between V(A) and N(R) are sent and unacknowledged, the uplinker doesn't overwrite them, so they are read without tx_lock
+        traces = [trx.frame_backlog[seq % trx.modulo]["Trace"] for seq in range(trx.state_variables['va'], trx.state_variables['va'] + (nr - trx.state_variables['va'])%trx.modulo)
+                  if trx.frame_backlog[seq % trx.modulo] is not None and trx.frame_backlog[seq % trx.modulo].get("Trace") is not None]
+
+        trx.state_variables['va'] = nr # Update acknowledgement state variable
+        if trx.pass_start is not None and not trx.pass_acked:
+            trx.pass_acked = True
+            trx.pass_setup_times.append(time.time() - trx.pass_start)
+            trx.logger.debug("First I frame of the pass acknowledged %.2fms after first signal", trx.pass_setup_times[-1]*1000)
+        if traces:
+            return [trx.wake_uplinker, functools.partial(trx.tracer.acked, traces, time.time())]
+        return [trx.wake_uplinker] # Remote receive window may have opened
+
+    """ Supervisory or U frame request, the supervisory type follows our own receiver state if none is given """
+    def __response_request(self, frametype, poll, com):
+        if frametype is None:
+            frametype = 'RNR' if self.transceiver.own_busy else 'RR'
+        return {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":frametype, "Poll":poll, "Payload": None, "Com":com}
+
+    """ Publishes the monitor record of a received frame on Monitor out, as PDU with the record as metadata and the information field as data """
+    def __monitor(self, raw_frame, arrival):
+        try:
+            record = self.framer.monitor(raw_frame, self.transceiver.monitor_keys)
+            if record is None:
                 return
-            
-            #Actual missing frames, retransmit. Same procedure as in __REJ_frame_handler
-            sendstate_at_rej = self.transceiver.get_state_variable('vs')
-            self.transceiver.set_state_variable('vs', data["Nr"])
-            self.transceiver.logger.debug(f"Offset, transceiver at: {sendstate_at_rej}, remote expected: {data['Nr']}")
-
-            for iters in range((sendstate_at_rej - data["Nr"])%self.transceiver.modulo):
-                with self.transceiver.lock:
-                    self.transceiver.framequeue.insert(iters, self.transceiver.frame_backlog[(data["Nr"]+iters)%self.transceiver.modulo])
-                self.transceiver.logger.debug(f"Added frame from backlog pos {(data['Nr']+iters)%self.transceiver.modulo} to framequeue at pos {iters}")
-                
-            return
-        return
-
+            info = record.pop("info")
+            record["time"] = arrival
+            self.transceiver.gr_block.message_port_pub(pmt.intern('Monitor out'), pmt.cons(pmt.to_pmt(record), pmt.init_u8vector(len(info), list(info))))
+        except Exception as e:
+            self.transceiver.logger.warning("Exception occured during monitor out: %s", e)
 
-    def __acknowledgement_handler(self, data):
+    def __deliver(self, payload, port='Payload out'):
+        try:
+            if self.transceiver.logger.isEnabledFor(logging.DEBUG):
+                self.transceiver.logger.debug("Successfully received Data: %s", payload.hex())
+            self.transceiver.gr_block.message_port_pub(pmt.intern(port), pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(payload), list(payload))))
+        except Exception as e:
+            self.transceiver.logger.warning("Exception occured during payload out: %s", e)
 
-        if data["Nr"] == self.transceiver.get_state_variable("va"): return # No new frames have been acknolwedged, nothin to do
-                
-        if data["Nr"] == self.transceiver.get_state_variable("vs"): #All sent frames are acknowledged, stop timer t1
-            self.transceiver.timer_cancel_t1.set()
-        else: #Some new frames have been acknowledged, but not all, reset timer t1
-            self.transceiver.timer_reset_t1.set()
 
-        self.transceiver.set_state_variable("va", data["Nr"]) # = data["Nr"] # Update acknowledgement state variable
+    """
+    Go-back-N retransmission of all sent, unacknowledged frames starting at N(R).
+    Retransmissions still queued from an earlier recovery are dropped first, they would otherwise
+    go out again after this one and set V(S) back below the frames actually sent
+    """
+    def __retransmit_from(self, nr):
 
-        return
+        with self.transceiver.uplinker.framing_lock, self.transceiver.framequeue_not_empty:
+            stale = [request for request in self.transceiver.framequeue if request.get("Frame") is not None]
+            if stale:
+                self.transceiver.framequeue[:] = [request for request in self.transceiver.framequeue if request.get("Frame") is None]
 
+            sendstate_at_rej = (self.transceiver.get_state_variable('vs') + len(stale))%self.transceiver.modulo
+            self.transceiver.set_state_variable('vs', nr)
+            self.transceiver.logger.debug("Offset, transceiver at: %d, remote expected: %d", sendstate_at_rej, nr)
 
-            
-                
+            for iters in range((sendstate_at_rej - nr)%self.transceiver.modulo):
+                self.transceiver.framequeue.insert(iters, self.transceiver.frame_backlog[(nr+iters)%self.transceiver.modulo])
+                self.transceiver.logger.debug("Added frame from backlog pos %d to framequeue at pos %d", (nr+iters)%self.transceiver.modulo, iters)
 
-        
+            self.transceiver.framequeue_not_empty.notify()
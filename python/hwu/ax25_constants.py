@@ -50,3 +50,16 @@ U_FRAMES_INVERSE =  {'0111111': 'SABME',
                      '1110011': 'TEST'}
 
 PID = '0xF0'
+
+XID_FORMAT_INDICATOR = 0x82 #XID information field layout, see AX.25 2.2 section 4.3.3.7
+XID_GROUP_IDENTIFIER = 0x80
+XID_PI_CLASSES_OF_PROCEDURES = 2 #Parameter identifiers
+XID_PI_OPTIONAL_FUNCTIONS = 3
+XID_PI_N1_RX = 6 #Maximum I field length received, in bits
+XID_PI_WINDOW_RX = 8 #Window size k received
+XID_CLASSES_OF_PROCEDURES = {'ABM': 1 << 0, 'HALF_DUPLEX': 1 << 5, 'FULL_DUPLEX': 1 << 6} #Bit n of the spec is 1 << (n-1)
+XID_OPTIONAL_FUNCTIONS = {'REJ': 1 << 1, 'SREJ': 1 << 2, 'MODULO_8': 1 << 10, 'MODULO_128': 1 << 11, 'TEST': 1 << 13, 'FCS_16': 1 << 15, 'SYNC_TX': 1 << 17}
+
+LINK_STATES = ('DISC', 'AWAITING_CONNECTION', 'AWAITING_RELEASE', 'CONNECTED', 'TIMER_RECOVERY', 'BUSY') #Data link states the downlinker transition table is keyed on. BUSY is CONNECTED with our own receiver busy
+
+BIT_REVERSED_BYTES = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256)) #Translation table mirroring the bitorder of every byte value, for use with bytes.translate
@@ -21,32 +21,114 @@
 # Boston, MA 02110-1301, USA.
 #
 
-from concurrent.futures import thread
+import binascii
+import logging
 import bitstring as bs
-import crc
-import time
 # from .ax25_transceiver import Transceiver
 from .ax25_constants import *
 
 class Framer:
 
     flag = bs.Bits(bin='0b01111110', length=8)
+    C_FIELD_OFFSET = 14 # Control field position in an assembled frame, after destination and source address fields. Moved back by the digipeater path
+    MAX_REPEATERS = 8
 
     def __init__(self, transceiver) -> None:
         self.transceiver = transceiver
-        self.crc_calculator = crc.Calculator(crc.Crc16.KERMIT)
+        self.crc_shift_operators = self.__build_crc_shift_operators()
+        self.link = None
+        self.s_frame_table = {}
+        self.u_frame_table = {}
+        self.ui_header_table = {}
 
 
 
+    """
+    Used to set the addresses of the link this framer serves. Encodes the address fields
+    once and precomputes every supervisory frame and payload-less unnumbered frame the link
+    can send, so acknowledgements and link control are a table lookup instead of a full framing run.
+    For UI frames the stuffed header is cached, leaving only payload stuffing and FCS per frame
+
+    @return: None
+    """
+
+    def set_link_addresses(self, src_addr:str, src_ssid:int, dest_addr:str, dest_ssid:int):
+
+        self.link = (src_addr, src_ssid, dest_addr, dest_ssid)
+        self.C_FIELD_OFFSET = 14 + 7*len(self.transceiver.digipeater_path)
+        self.s_frame_table = {}
+        self.u_frame_table = {}
+        self.ui_header_table = {}
+
+        for command_response in ('COM', 'RES'):
+            local_src, local_dest = self.__encode_addresses(src_addr, src_ssid, dest_addr, dest_ssid, command_response)
+            for poll_final in (False, True):
+                """ Fully encoded U frames without information field """
+                for frametype in ('SABM', 'SABME', 'UA', 'DISC', 'DM'):
+                    self.u_frame_table[(frametype, poll_final, command_response)] = self.__build_U_frame(local_src, local_dest, frametype, None, poll_final)
+
+                """ Stuffed UI header (flag, addresses, control field), with its unstuffed bytes for the FCS and its trailing ones for continued stuffing """
+                c_field = bs.BitArray(bin=U_FRAMES['UI'][0]) + bs.BitArray(bool=poll_final) + bs.BitArray(bin=U_FRAMES['UI'][1])
+                header = local_dest.bytes + local_src.bytes + c_field.bytes
+                stuffed_header, trailing_ones = self.__stuff(bs.BitArray(bytes=header.translate(BIT_REVERSED_BYTES)))
+                self.ui_header_table[(poll_final, command_response)] = (header, bs.Bits(self.flag + stuffed_header), trailing_ones)
+
+        if self.transceiver.modulo != 8: # Control field layout of modulo 128 is not supported by the S frame builder yet
+            return
+
+        """ Fully stuffed S frame for every (type, N(R), P/F, COM/RES) combination """
+        for command_response in ('COM', 'RES'):
+            local_src, local_dest = self.__encode_addresses(src_addr, src_ssid, dest_addr, dest_ssid, command_response)
+            for frametype in S_FRAMES:
+                for nr in range(self.transceiver.modulo):
+                    for poll_final in (False, True):
+                        self.s_frame_table[(frametype, nr, poll_final, command_response)] = self.__build_S_frame(local_src, local_dest, frametype, nr, poll_final)
+
+
     """
     Used to build the bitstructure of the frame object
 
     @return: bytes bitframe
     """
     
-    def frame(self, frametype:str, src_addr:str, src_ssid:int , dest_addr:str, dest_ssid:int, pid:bs.Bits, payload:bytes, command_response:str, modulo=8, poll_final=False):
+    def frame(self, frametype:str, src_addr:str, src_ssid:int , dest_addr:str, dest_ssid:int, pid:bs.Bits, payload:bytes, command_response:str, modulo=8, poll_final=False, payload_crc=None, staged_payload=None, trace=None):
+
+        """ Supervisory and payload-less unnumbered frames of the configured link are served from the precomputed tables """
+        if (src_addr, src_ssid, dest_addr, dest_ssid) == self.link:
+            if frametype in S_FRAMES:
+                template = self.s_frame_table.get((frametype, self.transceiver.get_state_variable("vr"), bool(poll_final), command_response))
+            elif payload is None:
+                template = self.u_frame_table.get((frametype, bool(poll_final), command_response))
+            elif frametype == 'UI' and (bool(poll_final), command_response) in self.ui_header_table:
+                return self.__build_UI_frame(payload, poll_final, command_response)
+            else:
+                template = None
+            if template is not None:
+                return template
+
+        local_src, local_dest = self.__encode_addresses(src_addr, src_ssid, dest_addr, dest_ssid, command_response)
+
+        """ Call appropriate framing subfunction """
+
+        if frametype == 'I':
+
+            return self.__build_I_frame(local_src, local_dest, pid, payload, poll_final, payload_crc, staged_payload, trace)
+            
+        if frametype in S_FRAMES:
+
+            return self.__build_S_frame(local_src, local_dest, frametype, self.transceiver.get_state_variable("vr"), poll_final)
+                
+        if frametype in U_FRAMES:
+            
+            return self.__build_U_frame(local_src, local_dest, frametype, payload, poll_final)      
+
+        self.transceiver.logger.warning("Non-existend framtype provided for framing!")
+
+
+    """ Private function that encodes source and destination address fields """
+
+    def __encode_addresses(self, src_addr:str, src_ssid:int, dest_addr:str, dest_ssid:int, command_response:str):
 
-        # start_time = time.time()
         """ Turn source address to bits """
         local_src = bs.BitArray()
         while(len(src_addr) < 6):
@@ -54,12 +136,20 @@ class Framer:
         for letter in src_addr:
              local_src += bs.BitArray(int=ord(letter), length=8)
 
-        """ Turn source ssid to bits, with command/responce ecoding """
+        """ Turn source ssid to bits, with command/responce ecoding. The address extension bit is only set on the last address field """
+        path = self.transceiver.digipeater_path
+        extension = bs.Bits(bool=not path)
         if command_response == 'COM':
-            local_src += bs.Bits(bin='0b011', length=3) + bs.Bits(int=src_ssid, length=4) + bs.Bits(bin='0b1', length=1)
+            local_src += bs.Bits(bin='0b011', length=3) + bs.Bits(int=src_ssid, length=4) + extension
         if command_response == 'RES':
-            local_src += bs.Bits(bin='0b111', length=3) + bs.Bits(int=src_ssid, length=4) + bs.Bits(bin='0b1', length=1)
-        
+            local_src += bs.Bits(bin='0b111', length=3) + bs.Bits(int=src_ssid, length=4) + extension
+
+        """ Repeater addresses follow the source address, sent with the has-been-repeated bit cleared """
+        for position, (repeater_addr, repeater_ssid) in enumerate(path):
+            for letter in repeater_addr.ljust(6):
+                local_src += bs.BitArray(int=ord(letter), length=8)
+            local_src += bs.Bits(bin='0b011', length=3) + bs.Bits(uint=repeater_ssid, length=4) + bs.Bits(bool=position == len(path) - 1)
+
 
         """ Turn destination address to bits """
         local_dest = bs.BitArray()
@@ -75,87 +165,109 @@ class Framer:
         if command_response == 'RES':
             local_dest += bs.Bits(bin='0b011', length=3) + bs.Bits(int=dest_ssid, length=4) + bs.Bits(bin='0b0', length=1)
 
-        # self.transceiver.logger.debug(f"Preparation took: {round((time.time() - start_time)*1000)} ms")
+        return local_src, local_dest
 
-        """ Call appropriate framing subfunction """
 
-        if frametype == 'I':
+    """ Private function that builds I frames """
 
-            return self.__build_I_frame(local_src, local_dest, pid, payload, poll_final)
-            
-        if frametype in S_FRAMES:
+    def __build_I_frame(self, src:bs.Bits, dest:bs.Bits, pid:bs.Bits, payload:bytes, poll_final:bool=False, payload_crc=None, staged_payload=None, trace=None):
 
-            return self.__build_S_frame(local_src, local_dest, frametype, poll_final)
-                
-        if frametype in U_FRAMES:
-            
-            return self.__build_U_frame(local_src, local_dest, frametype, payload, poll_final)      
+        if self.transceiver.modulo == 8:
+            """ Peprare control field """
+            c_field = bs.BitArray(uint=self.transceiver.get_state_variable("vr"), length=3) + bs.BitArray(bool=poll_final) + bs.BitArray(uint=self.transceiver.get_state_variable("vs"), length=3) + bs.BitArray(int=0, length=1)
 
-        self.transceiver.logger.warning("Non-existend framtype provided for framing!")
+            """ Assemble unstuffed frame, kept in the backlog for retransmission """
+            header = dest.bytes + src.bytes + c_field.bytes + pid.bytes
+            assembled = header + payload
 
+            """ Payload CRC is normally precomputed on enqueue, combine it with the header CRC """
+            if payload_crc is None:
+                payload_crc = self.calc_checksum(payload)
+            fcs = self.combine_checksum(self.calc_checksum(header), payload_crc, len(payload))
 
-    """ Private function that builds I frames """
+            current_send_state = self.transceiver.get_state_variable("vs")
 
-    def __build_I_frame(self, src:bs.Bits, dest:bs.Bits, pid:bs.Bits, payload:bytes, poll_final:bool=False):
+            with self.transceiver.tx_lock:
+                self.transceiver.frame_backlog[current_send_state] = {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type": 'I', "Poll": poll_final, "Payload": payload, "Com": 'COM', "Frame": assembled, "PayloadCRC": payload_crc, "Trace": trace}
 
-        start_time = time.time()
+            self.transceiver.set_state_variable("vs", ((current_send_state + 1)%self.transceiver.modulo))
 
-        if self.transceiver.modulo == 8:
-            """ Peprare control field """
-            # lock_time = time.time() - start_time
-            c_field = bs.BitArray(uint=self.transceiver.get_state_variable("vr"), length=3) + bs.BitArray(bool=poll_final) + bs.BitArray(uint=self.transceiver.get_state_variable("vs"), length=3) + bs.BitArray(int=0, length=1)
-            
-            # c_field_time = time.time() - start_time - lock_time
-            """ Turn payload into bits and perform crc calculation"""
+            if staged_payload is None:
+                return self.__finish_frame(assembled, fcs)
 
-            
-            info = bs.BitArray(bytes=payload)
-            fcs = bs.BitArray(uint=self.calc_checksum(dest.bytes + src.bytes + c_field.bytes + pid.bytes + info.bytes), length=16)
-            # checksum_time = time.time() - start_time - c_field_time - lock_time
+            """ Payload was already mirrored and stuffed by stage_payload, only header and FCS are left """
+            stuffed_payload, trailing_ones = staged_payload
+            stuffed_header, _ = self.__stuff(bs.BitArray(bytes=header.translate(BIT_REVERSED_BYTES)))
+            stuffed_fcs, _ = self.__stuff(bs.BitArray(uint=fcs, length=16), trailing_ones)
 
-            """ Form Frame """
-            bitframe = bs.BitArray()
-            bitframe = self.flag.tobitarray() #Doesn't need mirror for LSB, because it symmetrical
-            bitframe += dest
-            bitframe += src
-            bitframe += c_field
-            bitframe += pid
-            bitframe += info
-            bitframe += fcs
-            # Change/Add things here for bigger payloads (e.g. files), so the flag isn't sent twice
-            bitframe += self.flag.bytes
-            
-            # forming_time = time.time() - start_time - c_field_time - checksum_time - lock_time
+            return (self.flag + stuffed_header + stuffed_payload + stuffed_fcs + self.flag).tobytes()
 
-            """ Mirror bitorder per byte to get LSB first (when reading from left to right) """
-            for position in range(8, len(bitframe)-24, 8): # Start after flag and stop before fcs field
-                currentbyte = bitframe[position:position+8]
-                bitframe[position:position+8] = currentbyte[::-1]
 
-            # lsb_time = time.time()- start_time - c_field_time - checksum_time - forming_time - lock_time
+    """
+    Used to prepare the payload of a queued I frame ahead of sending, e.g. while the remote receive window is full.
+    Stuffing of the payload only depends on the run of ones the PID field ends with, which is fixed.
 
-            # Perform bitstuffing 
-            bitframe.replace('0b11111', '0b111110', 8, -8)
+    @return: tuple (stuffed payload bits, number of trailing ones) or None if the payload can't be staged
+    """
 
-            current_send_state = self.transceiver.get_state_variable("vs")
+    def stage_payload(self, pid:bs.Bits, payload:bytes):
 
-            with self.transceiver.lock:
-                # lock_time_stuffing = time.time() - start_time - c_field_time - checksum_time - forming_time - lsb_time - lock_time
-                self.transceiver.frame_backlog.insert(current_send_state, {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type": 'I', "Poll": poll_final, "Payload": payload, "Com": 'COM'})
+        mirrored_pid = bs.BitArray(bytes=pid.bytes.translate(BIT_REVERSED_BYTES))
+        if mirrored_pid.all(1): # Carried run of ones would depend on the control field
+            return None
+        carried_ones = len(mirrored_pid) - 1 - mirrored_pid.rfind('0b0')[0]
 
-            self.transceiver.set_state_variable("vs", ((current_send_state + 1)%self.transceiver.modulo))
+        return self.__stuff(bs.BitArray(bytes=payload.translate(BIT_REVERSED_BYTES)), carried_ones)
+
+
+    """
+    Used to retransmit an I frame from the assembled frame kept in the backlog.
+    Only N(R) and P in the control field are patched, N(S) and the payload stay as sent originally.
+
+    @return: bytes bitframe
+    """
+
+    def reframe(self, assembled:bytes, poll_final:bool=False, payload_crc=None):
+
+        c_field = assembled[self.C_FIELD_OFFSET]
+        send_state = (c_field >> 1) & 0b111
+        c_field = (self.transceiver.get_state_variable("vr") << 5) | (int(poll_final) << 4) | (c_field & 0b1111)
+
+        assembled = assembled[:self.C_FIELD_OFFSET] + bytes((c_field,)) + assembled[self.C_FIELD_OFFSET+1:]
+
+        self.transceiver.set_state_variable("vs", ((send_state + 1)%self.transceiver.modulo))
+
+        if payload_crc is None:
+            return self.__finish_frame(assembled)
+
+        header_len = self.C_FIELD_OFFSET + 2 # Control field and PID
+        fcs = self.combine_checksum(self.calc_checksum(assembled[:header_len]), payload_crc, len(assembled) - header_len)
+
+        return self.__finish_frame(assembled, fcs)
+
+
+    """ Private function that adds FCS, mirrors bitorder, performs bitstuffing and adds flags to an assembled frame """
+
+    def __finish_frame(self, assembled:bytes, fcs=None):
+
+        if fcs is None:
+            fcs = self.calc_checksum(assembled)
+
+        """ Mirror bitorder per byte to get LSB first, FCS is appended as is """
+        body = bs.BitArray(bytes=assembled.translate(BIT_REVERSED_BYTES))
+        body.append(bs.Bits(uint=fcs, length=16))
 
-            # stuffing_time = time.time() - start_time - c_field_time - checksum_time - forming_time - lsb_time - lock_time_stuffing - lock_time
-              
-            return bitframe
+        stuffed, _ = self.__stuff(body)
+
+        return (self.flag + stuffed + self.flag).tobytes()
         
 
     """ Private function that builds S frames """
 
-    def __build_S_frame(self, src, dest, frametype, poll_final=False):
+    def __build_S_frame(self, src, dest, frametype, nr, poll_final=False):
 
         """ Prepare control field """
-        c_field = bs.BitArray(uint=self.transceiver.get_state_variable("vr"), length=3) + bs.BitArray(bool=poll_final) + bs.BitArray(bin=S_FRAMES[frametype])
+        c_field = bs.BitArray(uint=nr, length=3) + bs.BitArray(bool=poll_final) + bs.BitArray(bin=S_FRAMES[frametype])
 
         """ Calculate CRC"""
 
@@ -177,7 +289,7 @@ class Framer:
 
         bitframe.replace('0b11111', '0b111110', 8, -8)
 
-        return bitframe
+        return bitframe.tobytes()
 
     """ Private function that builds U frames """
 
@@ -219,59 +331,110 @@ class Framer:
         
         bitframe.replace('0b11111', '0b111110', 8, -8)
 
-        return bitframe
+        return bitframe.tobytes()
+
+
+    """ Private function that builds UI frames of the configured link from the cached header """
+
+    def __build_UI_frame(self, payload:bytes, poll_final:bool, command_response:str):
+
+        header, stuffed_header, trailing_ones = self.ui_header_table[(bool(poll_final), command_response)]
+
+        """ Only the payload needs mirroring, FCS is sent as is """
+        body = bs.BitArray(bytes=payload.translate(BIT_REVERSED_BYTES))
+        body.append(bs.Bits(uint=self.calc_checksum(header + payload), length=16))
 
+        stuffed_body, _ = self.__stuff(body, trailing_ones)
 
-    """ Used to deframe an incoming frame and retreive information 
+        return (stuffed_header + stuffed_body + self.flag).tobytes()
 
-        @return: dict [Type, Poll, Pid-Data, Nr, Ns, Com]
+
+    """ 
+    Private function that performs bitstuffing, continuing a run of ones carried in from preceding bits
+
+    @return: tuple (stuffed bits, number of trailing ones)
     """
-    def deframe(self, bitframe:bs.BitArray):
+
+    def __stuff(self, bits:bs.BitArray, carried_ones:int=0):
+
+        stuffed = bs.BitArray(uint=(1 << carried_ones) - 1, length=carried_ones) + bits if carried_ones else bs.BitArray(bits)
+        stuffed.replace('0b11111', '0b111110')
+
+        trailing_ones = 0 # Counted before removing the carried ones, so the run continues through short inputs
+        while trailing_ones < len(stuffed) and stuffed[-1-trailing_ones]:
+            trailing_ones += 1
+
+        del stuffed[:carried_ones]
+
+        return stuffed, trailing_ones
+
+
+    """ Used to deframe an incoming frame and retreive information.
+        Works on the received bytes directly, the only copy made is the one undoing the LSB first bitorder
+
+        @return: dict [Type, Poll, Pid-Data, Nr, Ns, Com], Pid-Data as bytes
+    """
+    def deframe(self, frame:bytes):
+
+        if isinstance(frame, bs.Bits):
+            """ Check if frame is octet aligned """
+            if frame.len % 8 != 0:
+                self.transceiver.logger.debug("Frame not octet aligned: mod %d", frame.len % 8)
+                return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
+            frame = frame.tobytes()
 
         """ Check for 0 length frame reception """
-        if bitframe.len == 0:
+        if len(frame) == 0:
             self.transceiver.logger.debug("Zero bit frame received")
             return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
 
-        """ Check if frame is octet aligned """
-        if bitframe.len % 8 != 0:
-            self.transceiver.logger.debug(f"Frame not octet aligned: mod {bitframe.len % 8}")
-            return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
-        
-        """ Undo LSB order """
-        for position in range(0, len(bitframe)-16, 8): #Start at first bit, stop before fcs field. 0x7e flag has already been taken off
-            currentbyte = bitframe[position:position+8]
-            bitframe[position:position+8] = currentbyte[::-1]
-        
-        
-        try:
-            dest_addr, dest_ssid, src_addr, src_ssid, c_field, pid_and_info, fcs_field = bitframe.unpack('bits:48, bits:8, bits:48, bits:8, bits:8, bits, bits:16')
-        except:
+        if len(frame) < self.C_FIELD_OFFSET + 3: # Addresses, control field and FCS
             self.transceiver.logger.warning("Unpacking frame failed")
             return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
+
+        """ Undo LSB order, FCS is sent as is """
+        body = frame[:-2].translate(BIT_REVERSED_BYTES)
+        fcs_field = int.from_bytes(frame[-2:], 'big')
+
         try:
-            if dest_addr.tobytes().decode() != self.transceiver.src_addr: #or dest_ssid.uint != transceiver.src_ssid: Moved to before checksum, to filter out 
+            if body[0:6].decode() != self.transceiver.src_addr: #or dest_ssid.uint != transceiver.src_ssid: Moved to before checksum, to filter out 
                 self.transceiver.logger.debug("Frame Addresses some other receiver")
                 return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
         except UnicodeDecodeError: #This means its idle data from the radio that can't be decoded
             return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
 
 
-        fcs = self.calc_checksum(dest_addr.bytes + dest_ssid.bytes + src_addr.bytes + src_ssid.bytes + c_field.bytes + pid_and_info.bytes)
-        if fcs != fcs_field.uint:
-            self.transceiver.logger.debug(f"Error in CRC in frame: {dest_addr.hex + dest_ssid.hex + src_addr.hex + src_ssid.hex + c_field.hex + pid_and_info.hex}")
-            self.transceiver.logger.debug(f"Full frame: {bitframe.hex}")
-            self.transceiver.logger.debug(f"Sent CRC: {fcs_field.uint}, calculated: {fcs}")
+        fcs = self.calc_checksum(body)
+        if fcs != fcs_field:
+            if self.transceiver.logger.isEnabledFor(logging.DEBUG): # Noise on the channel makes these frequent, hex dumps only when they are written
+                self.transceiver.logger.debug("Error in CRC in frame: %s", body.hex())
+                self.transceiver.logger.debug("Full frame: %s", frame.hex())
+                self.transceiver.logger.debug("Sent CRC: %d, calculated: %d", fcs_field, fcs)
+            self.transceiver.metrics.count('crc_errors')
             return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
         
 
         
-        com = 'COM' if dest_ssid[0] == 1 and src_ssid[0] == 0 else 'RES'
+        """ Skip the repeater addresses up to the one with the address extension bit set """
+        c_field_offset = 14
+        while not body[c_field_offset - 1] & 0x01:
+            if c_field_offset >= 14 + 7*self.MAX_REPEATERS or c_field_offset + 7 >= len(body):
+                self.transceiver.logger.debug("Address field without end")
+                return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
+            if not body[c_field_offset + 6] & 0x80: # Heard directly, the copy the repeater sends on is the one to process
+                self.transceiver.logger.debug("Frame not yet repeated by %r", body[c_field_offset:c_field_offset + 6])
+                return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
+            c_field_offset += 7
+
+        com = 'COM' if body[6] & 0x80 and not body[13] & 0x80 else 'RES'
+        c_field = body[c_field_offset]
+        pid_and_info = body[c_field_offset+1:]
+        poll = bool(c_field & 0b10000)
             
         """ Extract control field data to return """
-        if c_field[-1] == 0: # For an Information Frame
+        if c_field & 0b1 == 0: # For an Information Frame
 
-            nr, poll, ns, _ = c_field.unpack('uint:3, bool, uint:3, bool')
+            nr, ns = c_field >> 5, (c_field >> 1) & 0b111
             if ns == self.transceiver.get_state_variable("vr"):
                 frametype = "I"
                 return {"Type": frametype, "Poll": poll, "Pid-Data": pid_and_info, "Nr": nr, "Ns":ns, "Com": com}
@@ -282,37 +445,259 @@ class Framer:
                 return {"Type": frametype, "Poll": poll, "Pid-Data": pid_and_info, "Nr": nr, "Ns":ns, "Com": com}
             
 
-        elif c_field[-1] == 1 and c_field[-2] == 0: # For a supervisory frame
+        elif c_field & 0b11 == 0b01: # For a supervisory frame
 
-            nr, poll, frametype_bits = c_field.unpack('uint:3, bool, bits:4')
+            nr = c_field >> 5
             try:
-                frametype = S_FRAMES_INVERSE[frametype_bits.bin]
+                frametype = S_FRAMES_INVERSE[f"{c_field & 0b1111:04b}"]
             except:
                 self.transceiver.logger.debug("Frametype Error, invalid c_field encoding")
                 return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
                 
             return {"Type": frametype, "Poll": poll, "Pid-Data": pid_and_info, "Nr": nr, "Ns":None, "Com": com}
         
-        elif c_field[-1] == 1 and c_field[-2] == 1: # For an unnumbered frame
-
-            frametype_bits1, poll, frametype_bits2 = c_field.unpack('bits:3, bool, bits:4')
-            frametype_bits = frametype_bits1 + frametype_bits2
+        else: # For an unnumbered frame
 
             try:
-                frametype = U_FRAMES_INVERSE[frametype_bits.bin]
+                frametype = U_FRAMES_INVERSE[f"{c_field >> 5:03b}{c_field & 0b1111:04b}"]
             except:
                 self.transceiver.logger.debug("Frametype Error, incalid c_field encoding!")
                 return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
             
             return {"Type": frametype, "Poll": poll, "Pid-Data": pid_and_info, "Nr": None, "Ns":None, "Com": com}
-
-        #we should never get here
-        self.transceiver.logger.debug("Something went wrong while decoding the c_field")
-        return {"Type": 'ERROR', "Poll": False, "Pid-Data": None, "Nr": None, "Ns":None, "Com": None}
     
-    """ Implementation of the checksum calculation
+
+    """
+    Digipeater fast path, works on a received frame as it came in (LSB first bytes and FCS) without deframing it.
+    If the next repeater in the address field that has not repeated the frame yet is one of ours, its has-been-repeated
+    bit is set and the FCS patched for that single bit, so only the bitstuffing is redone.
+    In the LSB first bytes of an SSID field the address extension bit is 0x80, has-been-repeated is 0x01 and the SSID is 0x78
+
+    @return: bytes bitframe to send on, or None if the frame is not ours to repeat
+    """
+    def digipeat(self, frame:bytes, repeater_keys:set):
+
+        end = len(frame) - 2 # FCS
+        if end < 14 + 7 + 1 or frame[13] & 0x80: # No repeater addresses
+            return None
+
+        position = 14
+        while frame[position + 6] & 0x01: # Already repeated, the next repeater is up
+            if frame[position + 6] & 0x80 or position >= 7 + 7*self.MAX_REPEATERS or position + 14 >= end:
+                return None
+            position += 7
+
+        if frame[position:position + 6] + bytes((frame[position + 6] & 0x78,)) not in repeater_keys:
+            return None
+        fcs = int.from_bytes(frame[end:], 'big')
+        if self.__wire_checksum(frame[:end]) != fcs:
+            return None
+
+        patched = bytearray(frame)
+        patched[position + 6] |= 0x01
+        fcs ^= self.combine_checksum(self.calc_checksum(b'\x80'), 0, end - position - 7) # Single bit change, bit 7 of the SSID field in MSB first order
+        patched[end:] = fcs.to_bytes(2, 'big')
+
+        stuffed, _ = self.__stuff(bs.BitArray(bytes=bytes(patched)))
+
+        return (self.flag + stuffed + self.flag).tobytes()
+
+
+    """
+    Monitor decoding of any valid frame, whoever it is addressed to. The address fields are matched against
+    watch_keys (see address_key) before anything is decoded, an empty set matches every frame.
+    Repeaters that have repeated the frame are marked with a '*'
+
+    @return: dict record with dest, src, path, type, poll, nr, ns, com, pid and info, or None if the frame is filtered out or invalid
+    """
+    def monitor(self, frame:bytes, watch_keys:set):
+
+        end = len(frame) - 2 # FCS
+        if end < 15:
+            return None
+
+        """ Address fields up to the one with the address extension bit set """
+        c_field_offset = 7
+        while not frame[c_field_offset + 6] & 0x80:
+            c_field_offset += 7
+            if c_field_offset >= 14 + 7*self.MAX_REPEATERS or c_field_offset + 7 >= end:
+                return None
+        c_field_offset += 7
+
+        if watch_keys and not any(frame[position:position + 6] + bytes((frame[position + 6] & 0x78,)) in watch_keys for position in range(0, c_field_offset, 7)):
+            return None
+        if self.__wire_checksum(frame[:end]) != int.from_bytes(frame[end:], 'big'):
+            return None
+
+        header = frame[:c_field_offset + 2].translate(BIT_REVERSED_BYTES)
+        addresses = [f"{header[position:position + 6].decode('ascii', 'replace').rstrip()}-{(header[position + 6] >> 1) & 0xF}" for position in range(0, c_field_offset, 7)]
+        for index in range(2, len(addresses)):
+            if header[7*index + 6] & 0x80:
+                addresses[index] += '*'
+
+        c_field = header[c_field_offset]
+        record = {"dest": addresses[0], "src": addresses[1], "path": addresses[2:],
+                  "com": 'COM' if header[6] & 0x80 and not header[13] & 0x80 else 'RES',
+                  "poll": bool(c_field & 0b10000), "nr": None, "ns": None, "pid": None}
+        info_offset = c_field_offset + 1
+
+        if c_field & 0b1 == 0:
+            record.update(type='I', nr=c_field >> 5, ns=(c_field >> 1) & 0b111)
+        elif c_field & 0b11 == 0b01:
+            record.update(type=S_FRAMES_INVERSE.get(f"{c_field & 0b1111:04b}", 'UNKNOWN'), nr=c_field >> 5)
+        else:
+            record.update(type=U_FRAMES_INVERSE.get(f"{c_field >> 5:03b}{c_field & 0b1111:04b}", 'UNKNOWN'))
+
+        if record["type"] in ('I', 'UI') and end > info_offset: # PID field
+            record["pid"] = header[info_offset]
+            info_offset += 1
+        record["info"] = frame[info_offset:end].translate(BIT_REVERSED_BYTES)
+
+        return record
+
+
+    """
+    Key of an address in the LSB first bytes of a received frame, as compared by digipeat. Only callsign and SSID
+    are kept of the SSID field
+
+    @return: bytes key
+    """
+    @staticmethod
+    def address_key(addr:str, ssid:int):
+        return (addr.ljust(6).encode() + bytes(((ssid & 0xF) << 1,))).translate(BIT_REVERSED_BYTES)
+
+
+    """
+    Parses an address given as 'CALL-SSID' or 'CALL'
+
+    @return: tuple (address, ssid)
+    """
+    @staticmethod
+    def parse_address(text:str):
+        addr, _, ssid = text.strip().upper().partition('-')
+        if not 0 < len(addr) <= 6 or not 0 <= int(ssid or 0) <= 15:
+            raise ValueError(f"Invalid address {text}")
+        return addr, int(ssid or 0)
+
+
+    """
+    XID information field advertising the given parameters, n1 in bytes, window size k, srej and full_duplex. Modulo is always 8
+
+    @return: bytes information field
+    """
+    def build_xid_info(self, parameters:dict):
+
+        classes = XID_CLASSES_OF_PROCEDURES['ABM'] | XID_CLASSES_OF_PROCEDURES['FULL_DUPLEX' if parameters['full_duplex'] else 'HALF_DUPLEX']
+        optional = XID_OPTIONAL_FUNCTIONS['REJ'] | XID_OPTIONAL_FUNCTIONS['TEST'] | XID_OPTIONAL_FUNCTIONS['FCS_16'] | XID_OPTIONAL_FUNCTIONS['SYNC_TX']
+        optional |= XID_OPTIONAL_FUNCTIONS['MODULO_8'] # I and S frames are built with one byte control fields only, modulo 128 is never advertised
+        if parameters['srej']:
+            optional |= XID_OPTIONAL_FUNCTIONS['SREJ']
+        n1_bits = parameters['n1']*8
+
+        group = b""
+        for identifier, value in ((XID_PI_CLASSES_OF_PROCEDURES, classes.to_bytes(2, 'big')),
+                                  (XID_PI_OPTIONAL_FUNCTIONS, optional.to_bytes(3, 'big')),
+                                  (XID_PI_N1_RX, n1_bits.to_bytes(max(2, (n1_bits.bit_length() + 7)//8), 'big')),
+                                  (XID_PI_WINDOW_RX, parameters['k'].to_bytes(1, 'big'))):
+            group += bytes([identifier, len(value)]) + value
+
+        return bytes([XID_FORMAT_INDICATOR, XID_GROUP_IDENTIFIER]) + len(group).to_bytes(2, 'big') + group
+
+
+    """
+    Parses an XID information field, parameters not present are left out, unknown ones are skipped
+
+    @return: dict with the keys of build_xid_info
+    """
+    def parse_xid_info(self, info:bytes):
+
+        if len(info) < 4 or info[0] != XID_FORMAT_INDICATOR or info[1] != XID_GROUP_IDENTIFIER:
+            raise ValueError(f"Unsupported XID information field: {info.hex()}")
+        group = info[4:4 + int.from_bytes(info[2:4], 'big')]
+
+        parameters = {}
+        position = 0
+        while position + 2 <= len(group):
+            identifier, length = group[position], group[position + 1]
+            value = int.from_bytes(group[position + 2:position + 2 + length], 'big')
+            position += 2 + length
+            if identifier == XID_PI_CLASSES_OF_PROCEDURES:
+                parameters['full_duplex'] = bool(value & XID_CLASSES_OF_PROCEDURES['FULL_DUPLEX'])
+            elif identifier == XID_PI_OPTIONAL_FUNCTIONS:
+                parameters['modulo'] = 128 if value & XID_OPTIONAL_FUNCTIONS['MODULO_128'] else 8
+                parameters['srej'] = bool(value & XID_OPTIONAL_FUNCTIONS['SREJ'])
+            elif identifier == XID_PI_N1_RX:
+                parameters['n1'] = value//8
+            elif identifier == XID_PI_WINDOW_RX:
+                parameters['k'] = value
+
+        return parameters
+
+
+    """ Implementation of the checksum calculation, CRC-16/KERMIT of the bytes as framed (MSB first).
+        Computed on the mirrored bytes like the wire checksum, binascii keeps no state so any thread may call it
     
         @return: int checksum
     """
     def calc_checksum(self, data:bytes):
-            return self.crc_calculator.checksum(data) & 0xFFFF # Effectively turns negative numbers back into positive, so int -> uint
\ No newline at end of file
+            return self.__wire_checksum(data.translate(BIT_REVERSED_BYTES))
+
+    """
+    Private function that calculates the checksum of frame bytes in LSB first order, as received, without mirroring them back.
+    The reflected CRC of the mirrored bytes is the bit reversed CCITT CRC of the received ones, which binascii computes in C
+
+    @return: int checksum
+    """
+    def __wire_checksum(self, wire:bytes):
+        checksum = binascii.crc_hqx(wire, 0)
+        return int.from_bytes(checksum.to_bytes(2, 'big').translate(BIT_REVERSED_BYTES)[::-1], 'big')
+
+    """ 
+    Combines the checksum of a leading block with the checksum of the following block of given length,
+    giving the checksum of both blocks concatenated. The cost is independent of the blocks lengths.
+    Valid because CRC-16/KERMIT has zero init and final xor, so it is linear over GF(2)
+
+    @return: int checksum
+    """
+    def combine_checksum(self, leading_crc:int, trailing_crc:int, trailing_length:int):
+
+        """ Advance leading CRC over trailing_length zero bytes, one precomputed operator per set bit of the length """
+        power = 0
+        while trailing_length:
+            if trailing_length & 1:
+                leading_crc = self.__gf2_matrix_times(self.crc_shift_operators[power], leading_crc)
+            trailing_length >>= 1
+            power += 1
+
+        return leading_crc ^ trailing_crc
+
+    """ 
+    Private function that builds the GF(2) operators advancing a CRC register over 2^n zero bytes, for n < 32.
+    Each operator is a list of 16 columns, the image of each single register bit
+
+    @return: list operators
+    """
+    def __build_crc_shift_operators(self):
+
+        """ Operator for a single zero bit of reflected CRC-16/KERMIT (polynomial 0x1021 reflected to 0x8408) """
+        operator = [0x8408] + [1 << (bit - 1) for bit in range(1, 16)]
+        for _ in range(3): # Square to one zero byte
+            operator = [self.__gf2_matrix_times(operator, column) for column in operator]
+
+        operators = []
+        for _ in range(32):
+            operators.append(operator)
+            operator = [self.__gf2_matrix_times(operator, column) for column in operator]
+
+        return operators
+
+    @staticmethod
+    def __gf2_matrix_times(operator:list, vector:int):
+        result = 0
+        column = 0
+        while vector:
+            if vector & 1:
+                result ^= operator[column]
+            vector >>= 1
+            column += 1
+        return result
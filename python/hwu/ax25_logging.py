@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+
+
+""" Drops repeats of the same warning beyond burst per interval seconds. The first one let through again reports how many were dropped """
+class RateLimitFilter(logging.Filter):
+
+    MAX_KEYS = 1024 # Messages formatted eagerly are unique, forget them all at once instead of growing without bound
+
+    def __init__(self, burst=5, interval=10.0, level=logging.WARNING) -> None:
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.level = level # Only records at or above are limited, debug output is gated by the logger level
+        self.lock = threading.Lock()
+        self.windows = {} # (level, message template): [window start, records let through, records dropped]
+
+    def filter(self, record) -> bool:
+
+        if self.burst <= 0 or record.levelno < self.level:
+            return True
+
+        key = (record.levelno, str(record.msg))
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                if len(self.windows) >= self.MAX_KEYS:
+                    self.windows.clear()
+                self.windows[key] = [record.created, 1, 0]
+                dropped = window[2] if window is not None else 0
+            elif window[1] < self.burst:
+                window[1] += 1
+                dropped = 0
+            else:
+                window[2] += 1
+                return False
+
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        return True
+
+
+_listeners = {} # Logger name: QueueListener writing its records, stopped when the logger is set up again
+
+"""
+Sets up the logger of a transceiver, writing to filename. With async_logging the records are put on a queue and written by
+a listener thread, so file I/O stays off the up- and downlink threads. Callers pass format arguments instead of building
+f-strings, so records below level cost a level check only
+@return: tuple (logger, file handler)
+"""
+def setup_logger(name:str, filename:str, level='INFO', async_logging=True, rate_limit_burst=5, rate_limit_interval=10.0):
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    listener = _listeners.pop(name, None)
+    if listener is not None: # A block created again in the same process, e.g. in the QA tests. Its listener thread writes out what is queued and ends
+        listener.stop()
+        atexit.unregister(listener.stop)
+        for handler in listener.handlers:
+            handler.close()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.filters = [RateLimitFilter(rate_limit_burst, rate_limit_interval)]
+
+    file_handler = logging.FileHandler(filename, mode='w')
+    file_handler.setLevel(logging.DEBUG)
+
+    if async_logging:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop) # Writes out what is still queued
+        _listeners[name] = listener
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        logger.addHandler(file_handler)
+
+    return logger, file_handler
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+import bisect
+import collections
+import itertools
+import threading
+import time
+
+
+""" Link metrics. Counters and latency histograms, read with snapshot() and published periodically on Stats out """
+class Metrics:
+
+    BUCKETS = tuple(0.0001 * 2**n for n in range(18)) # Histogram upper bounds in seconds, 0.1 ms doubling up to 13 s, one more bucket above
+
+    def __init__(self, transceiver, interval=1.0) -> None:
+        self.transceiver = transceiver
+        self.interval = interval # Seconds between publications on Stats out, 0 disables
+        self._thread = threading.Thread(target=self._run, name="Metrics Thread", daemon=True)
+        self._kill = threading.Event()
+        self.lock = threading.Lock()
+        self.counters = {} # Name: count, e.g. sent_I, received_REJ, retransmissions, crc_errors
+        self.histograms = {} # Name: [count, total seconds, max seconds, bucket counts]
+
+
+    """ Start publishing on Stats out, nothing is done if the interval is 0 """
+    def start(self) -> None:
+
+        if self.interval <= 0 or self._thread.is_alive():
+            return
+        try:
+            self._thread.start()
+        except Exception as e:
+            self.transceiver.logger.warning("Could not start metrics thread, due to %s", e)
+
+    def _run(self) -> None:
+
+        while not self._kill.wait(timeout=self.interval):
+            self.publish()
+
+
+    def count(self, name:str, amount:int=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name:str, seconds:float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [0, 0.0, 0.0, [0]*(len(self.BUCKETS) + 1)]
+            histogram[0] += 1
+            histogram[1] += seconds
+            histogram[2] = max(histogram[2], seconds)
+            histogram[3][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+
+    """
+    Summary of a latency histogram. Percentiles are the upper bound of the bucket they fall in, at most the maximum seen
+    @return: dict with count, mean, max, p50, p90 and p99 in seconds, or None if nothing was observed
+    """
+    def latency(self, name:str):
+
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                return None
+            count, total, maximum, buckets = histogram[0], histogram[1], histogram[2], list(histogram[3])
+
+        summary = {"count": count, "mean": total/count, "max": maximum}
+        for key, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            rank = fraction*count
+            seen = 0
+            for bucket, bucket_count in enumerate(buckets):
+                seen += bucket_count
+                if seen >= rank:
+                    break
+            summary[key] = min(self.BUCKETS[bucket] if bucket < len(self.BUCKETS) else maximum, maximum)
+        return summary
+
+
+    """
+    Current metrics of the link, counters and latencies together with the state read from the transceiver:
+    queue depths, outstanding I frames V(S)-V(A), frames per key-up, state transition times and pass setup times
+    @return: dict
+    """
+    def snapshot(self) -> dict:
+
+        trx = self.transceiver
+        with self.lock:
+            counters = dict(self.counters)
+            names = list(self.histograms)
+        with trx.tx_lock:
+            framequeue = len(trx.framequeue)
+        with trx.rx_lock:
+            frame_input_queue = len(trx.frame_input_queue)
+
+        return {"time": time.time(),
+                "state": trx.get_state(),
+                "counters": counters,
+                "latency": {name: self.latency(name) for name in names},
+                "framequeue": framequeue,
+                "frame_input_queue": frame_input_queue,
+                "tx_queued": trx.get_tx_queued(),
+                "rx_buffered": trx.get_rx_buffered(),
+                "outstanding": (trx.get_state_variable('vs') - trx.get_state_variable('va'))%trx.modulo,
+                "frames_per_key_up": trx.uplinker.get_frames_per_key_up(),
+                "transitions": {f"{state}/{frametype}": {"count": count, "mean": mean, "max": maximum}
+                                for (state, frametype), (count, mean, maximum) in trx.downlinker.get_transition_stats().items()},
+                "pass_setup_times": trx.get_pass_setup_times()}
+
+
+    def publish(self) -> None:
+        try:
+            snapshot = self.snapshot()
+            self.transceiver.gr_block.publish_stats(snapshot)
+        except Exception as e:
+            self.transceiver.logger.warning("Exception occured when publishing stats: %s", e)
+
+
+"""
+Per-payload tracing from Payload in to acknowledgement. The trace stamped on arrival travels with the request into the
+frame backlog and with every retransmission. Latencies go to the metrics histograms enqueue_to_send, send_to_ack and enqueue_to_ack
+"""
+class Tracer:
+
+    def __init__(self, transceiver, enabled=False) -> None:
+        self.transceiver = transceiver
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.records = collections.deque(maxlen=1024) # Most recent acknowledged payloads
+
+
+    """ @return: dict trace for a payload arriving now, None if tracing is off """
+    def stamp(self):
+        if not self.enabled:
+            return None
+        return {"id": next(self.ids), "enqueued": time.time(), "sent": None, "sends": 0, "acked": False}
+
+    """ Called once the frames carrying the traces went out, the first send counts for enqueue_to_send """
+    def sent(self, traces, when:float) -> None:
+        for trace in traces:
+            with self.lock:
+                trace["sends"] += 1
+                if trace["sent"] is not None:
+                    continue
+                trace["sent"] = when
+            self.transceiver.metrics.observe('enqueue_to_send', when - trace["enqueued"])
+
+    """ Called when N(R) acknowledged the frames carrying the traces, emits one record per payload """
+    def acked(self, traces, when:float) -> None:
+        for trace in traces:
+            with self.lock:
+                if trace["acked"] or trace["sent"] is None:
+                    continue
+                trace["acked"] = True
+            record = {"id": trace["id"],
+                      "enqueue_to_send": trace["sent"] - trace["enqueued"],
+                      "send_to_ack": when - trace["sent"],
+                      "enqueue_to_ack": when - trace["enqueued"],
+                      "retransmissions": trace["sends"] - 1}
+            self.transceiver.metrics.observe('send_to_ack', record["send_to_ack"])
+            self.transceiver.metrics.observe('enqueue_to_ack', record["enqueue_to_ack"])
+            self.records.append(record)
+            try:
+                self.transceiver.gr_block.publish_trace(record)
+            except Exception as e:
+                self.transceiver.logger.warning("Exception occured when publishing trace: %s", e)
+
+    """ @return: list of the most recent trace records """
+    def get_records(self) -> list:
+        return list(self.records)
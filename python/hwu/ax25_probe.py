@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+import struct
+import threading
+import time
+
+
+""" In-band link probe. TEST frames carrying a sequence number and send time are echoed by the remote """
+class Probe:
+
+    HEADER = struct.Struct('>HId') # Run id, sequence number, send time
+
+    def __init__(self, transceiver) -> None:
+        self.transceiver = transceiver
+        self._thread = None
+        self.lock = threading.Lock()
+        self.echo_received = threading.Event()
+        self.run_id = 0
+        self.echoes = {} # Sequence number: (round trip time, arrival time)
+
+
+    """
+    Starts probing the link in the background, callback is called with the results once all sizes are done.
+    @return: False if a probe is still running
+    """
+    def start(self, sizes=(64, 256, 1024), count=20, callback=None) -> bool:
+
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._run, args=[sizes, count, callback], name="Probe Thread", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, sizes, count, callback) -> None:
+
+        try:
+            results = self.run(sizes, count)
+        except Exception as e:
+            self.transceiver.logger.warning("Link probe failed: %s", e)
+            return
+        if callback is not None:
+            callback(results)
+
+
+    """
+    Probes the link with each TEST frame size, first one frame at a time for the round trip time, then with
+    count frames back to back for the frame rate the link sustains. Sizes are limited to N1.
+    @return: list of dicts with size, sent, received, loss, rtt_min, rtt_mean, rtt_median, rtt_p90, rtt_max (seconds), frame_rate (1/s) and throughput (bit/s)
+    """
+    def run(self, sizes, count) -> list:
+
+        timeout = self.transceiver.timers.timer_t1_seconds
+        results = []
+        for size in sizes:
+            size = min(max(size, self.HEADER.size), self.transceiver.information_field_length)
+
+            # Round trip times, one frame in flight
+            self.__new_run()
+            for seq in range(count):
+                self.echo_received.clear()
+                self.__send(seq, size)
+                deadline = time.time() + timeout
+                while seq not in self.echoes and time.time() < deadline:
+                    self.echo_received.wait(timeout=deadline - time.time())
+                    self.echo_received.clear()
+            with self.lock:
+                rtts = sorted(rtt for rtt, _ in self.echoes.values())
+
+            # Frame rate, all frames queued at once
+            self.__new_run()
+            first_sent = time.time()
+            for seq in range(count):
+                self.__send(seq, size)
+            deadline = time.time() + timeout
+            while len(self.echoes) < count and time.time() < deadline:
+                self.echo_received.wait(timeout=0.1)
+                self.echo_received.clear()
+            with self.lock:
+                burst_received = len(self.echoes)
+                last_arrival = max((arrival for _, arrival in self.echoes.values()), default=first_sent)
+
+            frame_rate = burst_received / (last_arrival - first_sent) if last_arrival > first_sent else 0.0
+            result = {"size": size,
+                      "sent": 2*count,
+                      "received": len(rtts) + burst_received,
+                      "loss": 1 - (len(rtts) + burst_received) / (2*count) if count else 0.0,
+                      "rtt_min": rtts[0] if rtts else None,
+                      "rtt_mean": sum(rtts) / len(rtts) if rtts else None,
+                      "rtt_median": rtts[len(rtts)//2] if rtts else None,
+                      "rtt_p90": rtts[min(int(len(rtts)*0.9), len(rtts) - 1)] if rtts else None,
+                      "rtt_max": rtts[-1] if rtts else None,
+                      "frame_rate": frame_rate,
+                      "throughput": frame_rate*size*8}
+            self.transceiver.logger.debug("Link probe: %s", result)
+            results.append(result)
+
+        return results
+
+
+    """ Called by the downlinker for every TEST response, echoes of earlier runs are ignored """
+    def handle_echo(self, info:bytes, arrival:float) -> None:
+
+        if len(info) < self.HEADER.size:
+            return
+        run_id, seq, send_time = self.HEADER.unpack_from(info)
+        with self.lock:
+            if run_id != self.run_id or seq in self.echoes:
+                return
+            self.echoes[seq] = (arrival - send_time, arrival)
+        self.echo_received.set()
+
+
+    def __new_run(self) -> None:
+        with self.lock:
+            self.run_id = (self.run_id + 1) % 65536
+            self.echoes = {}
+
+    def __send(self, seq:int, size:int) -> None:
+        info = self.HEADER.pack(self.run_id, seq, time.time()).ljust(size, b'\x00')
+        self.transceiver.queue_frame({"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid], "Type":'TEST', "Poll":False, "Payload": info, "Com":'COM'})
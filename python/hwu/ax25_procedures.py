@@ -41,7 +41,21 @@ class ax25_procedures(gr.basic_block):
                 ack_timer=3, 
                 retries=10, 
                 #pid=bs.Bits(hex='0xF0'), 
-                tcp_isServer=False):
+                tcp_isServer=False,
+                rx_high_watermark=0,
+                rx_low_watermark=0,
+                tx_high_watermark=0,
+                tx_low_watermark=0,
+                xid=True,
+                digipeat=False,
+                digipeater_path='',
+                monitor=False,
+                monitor_watchlist='',
+                stats_interval=1.0,
+                tracing=False,
+                log_level='INFO',
+                async_logging=True,
+                log_rate_limit=5):
         
 
         gr.basic_block.__init__(self,
@@ -60,6 +74,20 @@ class ax25_procedures(gr.basic_block):
                                        receive_window_k,
                                        ack_timer,
                                        retries,
+                                       rx_high_watermark=rx_high_watermark,
+                                       rx_low_watermark=rx_low_watermark,
+                                       tx_high_watermark=tx_high_watermark,
+                                       tx_low_watermark=tx_low_watermark,
+                                       xid=xid,
+                                       digipeat=digipeat,
+                                       digipeater_path=[repeater for repeater in digipeater_path.split(',') if repeater.strip()] if isinstance(digipeater_path, str) else digipeater_path,
+                                       monitor=monitor,
+                                       monitor_watchlist=[watched for watched in monitor_watchlist.split(',') if watched.strip()] if isinstance(monitor_watchlist, str) else monitor_watchlist,
+                                       stats_interval=stats_interval,
+                                       tracing=tracing,
+                                       log_level=log_level,
+                                       async_logging=async_logging,
+                                       log_rate_limit=log_rate_limit,
                                        gr_block=self)
         
     
@@ -67,25 +95,75 @@ class ax25_procedures(gr.basic_block):
         self.set_msg_handler(pmt.intern('Payload in'), self.handle_payload_in)
         self.message_port_register_in(pmt.intern('Frame in'))
         self.set_msg_handler(pmt.intern('Frame in'), self.handle_frame_in)
+        self.message_port_register_in(pmt.intern('Payload consumed'))
+        self.set_msg_handler(pmt.intern('Payload consumed'), self.handle_payload_consumed)
+        self.message_port_register_in(pmt.intern('Link control'))
+        self.set_msg_handler(pmt.intern('Link control'), self.handle_link_control)
+        self.message_port_register_in(pmt.intern('Probe'))
+        self.set_msg_handler(pmt.intern('Probe'), self.handle_probe)
+        self.message_port_register_in(pmt.intern('UI in'))
+        self.set_msg_handler(pmt.intern('UI in'), self.handle_ui_in)
+        self.message_port_register_in(pmt.intern('Profile'))
+        self.set_msg_handler(pmt.intern('Profile'), self.handle_profile)
         self.message_port_register_out(pmt.intern('Frame out'))
         self.message_port_register_out(pmt.intern('Payload out'))
+        self.message_port_register_out(pmt.intern('Flow control'))
+        self.message_port_register_out(pmt.intern('Probe out'))
+        self.message_port_register_out(pmt.intern('UI out'))
+        self.message_port_register_out(pmt.intern('Monitor out'))
+        self.message_port_register_out(pmt.intern('Stats out'))
+        self.message_port_register_out(pmt.intern('Trace out'))
 
         self.transceiver.uplinker.start()
         self.transceiver.downlinker.start()
         self.transceiver.timers.start()
+        self.transceiver.metrics.start()
 
 
     def handle_payload_in(self, msg_pmt):
         try:
-            with self.transceiver.lock:
-                self.transceiver.framequeue.append(
+            meta = pmt.car(msg_pmt)
+            if pmt.is_dict(meta) and pmt.to_bool(pmt.dict_ref(meta, pmt.intern('ui'), pmt.PMT_F)):
+                return self.handle_ui_in(msg_pmt)
+            payload = bytes(pmt.u8vector_elements(pmt.cdr(msg_pmt)))
+            if len(payload) > self.transceiver.information_field_length:
+                self.transceiver.logger.warning("Payload of %d bytes dropped, the link allows %d (N1)", len(payload), self.transceiver.information_field_length)
+                self.transceiver.metrics.count('payloads_dropped')
+                return
+            payload_crc = self.transceiver.framer.calc_checksum(payload) # Precomputed here, off the uplink thread. Combined with the header CRC at send time
+            # Accounted before queueing, the uplinker releases the bytes as soon as it frames the payload
+            # The handler must not block instead, Frame in is served by the same thread and the acknowledgements that drain the queue would stall with it
+            pause_producer = self.transceiver.add_tx_queued(len(payload))
+            self.transceiver.queue_frame(
                     {"Dest":[self.transceiver.dest_addr,
                             self.transceiver.dest_ssid],
                             "Type":'I',
                             "Poll":False,
-                            "Payload": bytes(pmt.u8vector_elements(pmt.cdr(msg_pmt))),
-                            "Com":'COM'}
+                            "Payload": payload,
+                            "Com":'COM',
+                            "PayloadCRC": payload_crc,
+                    "Trace": self.transceiver.tracer.stamp()}
                     )
+            if pause_producer:
+                self.transceiver.uplinker.send_flow_control()
+            self.transceiver.connect() # Link setup on demand, nothing is done if the link is up or being set up
+        except ValueError as e: 
+            self.transceiver.logger.debug(e)
+        except Exception as e:
+            self.transceiver.logger.debug(e)
+
+    """
+    Connectionless payloads, e.g. beacons and telemetry that tolerate loss. Sent as UI frames, without
+    acknowledgement, retransmission or link setup. PDUs on Payload in with 'ui' set in their metadata take this path too
+    """
+    def handle_ui_in(self, msg_pmt):
+        try:
+            payload = bytes(pmt.u8vector_elements(pmt.cdr(msg_pmt)))
+            if len(payload) > self.transceiver.information_field_length:
+                self.transceiver.logger.warning("UI payload of %d bytes dropped, the link allows %d (N1)", len(payload), self.transceiver.information_field_length)
+                self.transceiver.metrics.count('payloads_dropped')
+                return
+            self.transceiver.queue_ui_frame(payload)
         except ValueError as e: 
             self.transceiver.logger.debug(e)
         except Exception as e:
@@ -93,9 +171,102 @@ class ax25_procedures(gr.basic_block):
 
     def handle_frame_in(self, msg_pmt):
         try:
-            with self.transceiver.lock:
-                self.transceiver.frame_input_queue.append(msg_pmt)
+            self.transceiver.queue_input_frame(msg_pmt)
         except ValueError as e: 
             self.transceiver.logger.debug(e)
         except Exception as e:
             self.transceiver.logger.debug(e)
+
+    """
+    Flow control feedback from the consumer of Payload out. Either the consumed PDU is echoed back
+    or an integer number of consumed bytes is sent. Clears BUSY once the receive buffer has drained
+    to the low watermark, and tells the remote with RR that it may send again
+    """
+    def handle_payload_consumed(self, msg_pmt):
+        try:
+            if pmt.is_integer(msg_pmt):
+                nbytes = pmt.to_long(msg_pmt)
+            else:
+                nbytes = pmt.length(pmt.cdr(msg_pmt))
+            if self.transceiver.release_rx_buffered(nbytes):
+                self.transceiver.logger.debug("Receive buffer drained to %d bytes, leaving BUSY", self.transceiver.get_rx_buffered())
+                self.transceiver.queue_frame(
+                        {"Dest":[self.transceiver.dest_addr,
+                                self.transceiver.dest_ssid],
+                                "Type":'RR',
+                                "Poll":False,
+                                "Payload": None,
+                                "Com":'COM'}, 0
+                        )
+        except Exception as e:
+            self.transceiver.logger.debug(e)
+
+    """
+    Explicit link setup and release, 'connect' or 'disconnect'. Queued payloads also set up the link on their own,
+    and so does a frame from the remote while payloads are waiting
+    """
+    def handle_link_control(self, msg_pmt):
+        try:
+            command = pmt.symbol_to_string(msg_pmt)
+            if command == 'connect':
+                self.transceiver.connect()
+            elif command == 'disconnect':
+                self.transceiver.disconnect()
+            else:
+                self.transceiver.logger.warning("Unknown link control command %s", command)
+        except Exception as e:
+            self.transceiver.logger.debug(e)
+
+    """
+    Starts a link probe with TEST frames, the remote ax25_procedures block echoes them. The message is a dict with
+    optional keys 'sizes' (list of TEST frame sizes in bytes) and 'count' (frames per size), anything else uses the defaults.
+    One dict per size with RTT distribution, loss and frame rate is published on Probe out
+    """
+    def handle_probe(self, msg_pmt):
+        try:
+            options = pmt.to_python(msg_pmt) if pmt.is_dict(msg_pmt) else {}
+            arguments = {key: options[key] for key in ('sizes', 'count') if key in options}
+            if not self.transceiver.probe.start(callback=self.publish_probe_results, **arguments):
+                self.transceiver.logger.warning("Link probe already running")
+        except Exception as e:
+            self.transceiver.logger.debug(e)
+
+    """
+    Profiles the uplinker, downlinker and timer threads while the flowgraph runs, 'start' or 'stop'. A dict with 'enable'
+    and optionally 'interval' (seconds between samples) and 'filename' works too. On stop the hot spots per thread,
+    functions and innermost lines by share of samples, are written to ax25_<src_addr>_profile.txt unless another file is given
+    """
+    def handle_profile(self, msg_pmt):
+        try:
+            if pmt.is_dict(msg_pmt):
+                options = pmt.to_python(msg_pmt)
+                enable = bool(options.get('enable', True))
+            else:
+                options = {}
+                enable = pmt.symbol_to_string(msg_pmt) == 'start'
+            if enable:
+                if not self.transceiver.profiler.start(options.get('interval'), options.get('filename')):
+                    self.transceiver.logger.warning("Profiler already running")
+            elif self.transceiver.profiler.stop() is None:
+                self.transceiver.logger.warning("Profiler not running")
+        except Exception as e:
+            self.transceiver.logger.debug(e)
+
+    def publish_probe_results(self, results):
+        for result in results:
+            self.message_port_pub(pmt.intern('Probe out'), pmt.to_pmt(result))
+
+    """
+    Link metrics, published every stats_interval seconds as a dict: counters (frames sent and received per type,
+    retransmissions, polls, CRC errors, T1 timeouts), latency histogram summaries (framing, deframing, handler),
+    queue depths, outstanding I frames, frames per key-up, state transition times and pass setup times
+    """
+    def publish_stats(self, stats):
+        self.message_port_pub(pmt.intern('Stats out'), pmt.to_pmt(stats))
+
+    """
+    With tracing, one dict per acknowledged payload: id, enqueue_to_send, send_to_ack and enqueue_to_ack in seconds and the
+    number of retransmissions. Percentiles of the three latencies are part of the stats
+    """
+    def publish_trace(self, record):
+        self.message_port_pub(pmt.intern('Trace out'), pmt.to_pmt(record))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+import collections
+import os
+import sys
+import threading
+import time
+
+
+"""
+Sampling profiler for the uplinker, downlinker and timer threads, switched on and off while the flowgraph runs.
+The stacks of those threads are read every interval seconds, the profiled code itself is not instrumented.
+Next to functions the innermost line of this module is counted, so waits on a lock or condition show which one it is
+"""
+class Profiler:
+
+    MODULE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self, transceiver, interval=0.005) -> None:
+        self.transceiver = transceiver
+        self.interval = interval
+        self.filename = f'ax25_{transceiver.src_addr}_profile.txt'
+        self._thread = None
+        self._stop = threading.Event()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.samples = collections.Counter() # Thread role: samples taken
+            self.self_samples = collections.Counter() # (role, function): samples with the function innermost
+            self.total_samples = collections.Counter() # (role, function): samples with the function anywhere on the stack
+            self.line_samples = collections.Counter() # (role, file:line): samples with the line innermost of the module code
+            self.rounds = 0
+            self.started = time.time()
+
+
+    """
+    Starts a new profiling session, interval and filename replace the ones of earlier sessions if given.
+    @return: False if a session is already running
+    """
+    def start(self, interval=None, filename=None) -> bool:
+
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self.interval = interval or self.interval
+        self.filename = filename or self.filename
+        self.reset()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="Profiler Thread", daemon=True)
+        self._thread.start()
+        self.transceiver.logger.info("Profiling started, sampling every %.1fms", self.interval*1000)
+        return True
+
+    """
+    Ends the session and writes the hot spots of each thread to filename.
+    @return: dict report, see report(), or None if no session was running
+    """
+    def stop(self):
+
+        if self._thread is None or not self._thread.is_alive():
+            return None
+        self._stop.set()
+        self._thread.join()
+        report = self.report()
+        self.write(report)
+        self.transceiver.logger.info("Profiling stopped, hot spots written to %s", self.filename)
+        return report
+
+    def _run(self) -> None:
+
+        while not self._stop.wait(timeout=self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                self.transceiver.logger.warning("Profiler sample failed: %s", e)
+
+
+    """ Takes one sample of the stacks of all profiled threads """
+    def sample(self) -> None:
+
+        roles = self.__thread_roles()
+        frames = sys._current_frames()
+        with self.lock:
+            self.rounds += 1
+            for ident, role in roles.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                self.samples[role] += 1
+                self.self_samples[(role, self.__function(frame.f_code))] += 1
+                seen = set() # Recursion counts once per sample
+                line = None
+                while frame is not None:
+                    function = self.__function(frame.f_code)
+                    if function not in seen:
+                        seen.add(function)
+                        self.total_samples[(role, function)] += 1
+                    if line is None and frame.f_code.co_filename.startswith(self.MODULE_DIRECTORY):
+                        line = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+                        self.line_samples[(role, line)] += 1
+                    frame = frame.f_back
+
+
+    """
+    Hot spots per thread role, the top functions by samples spent in them (self) and below them (cumulative) and the top innermost module lines
+    @return: dict of role: dict with samples, seconds, self, cumulative and lines. Lists of (name, fraction of samples),
+    self entries carry the cumulative fraction of the function as well
+    """
+    def report(self, top=20) -> dict:
+
+        with self.lock:
+            duration = time.time() - self.started
+            report = {"duration": duration, "interval": self.interval}
+            for role, samples in self.samples.items():
+                ranked = lambda counter: [(name, count/samples) for (counter_role, name), count in counter.most_common() if counter_role == role][:top]
+                report[role] = {"samples": samples,
+                                "seconds": samples*duration/self.rounds, # Thread seconds, timers run on several threads
+                                "self": [(name, fraction, self.total_samples[(role, name)]/samples) for name, fraction in ranked(self.self_samples)],
+                                "cumulative": ranked(self.total_samples),
+                                "lines": ranked(self.line_samples)}
+        return report
+
+    def write(self, report) -> None:
+
+        with open(self.filename, 'w') as profile:
+            profile.write(f"Profile of {self.transceiver.src_addr}, {report['duration']:.1f}s sampled every {report['interval']*1000:.1f}ms\n")
+            for role in ('Uplinker', 'Downlinker', 'Timers'):
+                if role not in report:
+                    continue
+                profile.write(f"\n{role}: {report[role]['samples']} samples, ~{report[role]['seconds']:.2f}s\n")
+                profile.write(f"  {'self':>7} {'cumul':>7}  function\n")
+                for function, fraction, cumulative in report[role]["self"]:
+                    profile.write(f"  {fraction:>7.1%} {cumulative:>7.1%}  {function}\n")
+                profile.write("  Innermost module lines\n")
+                for line, fraction in report[role]["lines"]:
+                    profile.write(f"  {fraction:>7.1%}          {line}\n")
+
+
+    @staticmethod
+    def __function(code) -> str:
+        return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    """ @return: dict of thread ident: role """
+    def __thread_roles(self) -> dict:
+
+        trx = self.transceiver
+        roles = {trx.uplinker._thread.ident: 'Uplinker', trx.downlinker._thread.ident: 'Downlinker'}
+        for thread in trx.timers.get_threads():
+            roles[thread.ident] = 'Timers'
+        roles.pop(None, None) # Not started
+        return roles
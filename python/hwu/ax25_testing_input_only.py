@@ -50,6 +50,7 @@ class ax25_testing_input_only(gr.basic_block):
         self.set_msg_handler(pmt.intern('Payload in'), self.handle_payload_in)
         self.message_port_register_out(pmt.intern('Frame out'))
 
+        self.transceiver.set_state('CONNECTED') # Nothing would answer link setup
         self.transceiver.uplinker.start()
         self.transceiver.downlinker.start()
         self.transceiver.timers.start()
@@ -58,8 +59,7 @@ class ax25_testing_input_only(gr.basic_block):
     def handle_payload_in(self, msg_pmt):
         self.transceiver.logger.debug("Payload received")
         try:
-            with self.transceiver.lock:
-                self.transceiver.framequeue.append(
+            self.transceiver.queue_frame(
                     {"Dest":[self.transceiver.dest_addr,
                             self.transceiver.dest_ssid],
                             "Type":'I',
@@ -1,22 +1,30 @@
 import threading
 
-""" Implementation of main AX25 Timers T1 and T3 """
+""" Implementation of main AX25 Timers T1, T2 and T3 """
 class Timers:
 
-    def __init__(self, transceiver, timer_reset_t1, timer_cancel_t1, timer_reset_t3, timer_cancel_t3, timer_t1_seconds=2, timer_t3_seconds=5):
+    def __init__(self, transceiver, timer_reset_t1, timer_cancel_t1, timer_reset_t3, timer_cancel_t3, timer_start_t2, timer_cancel_t2, timer_t1_seconds=2, timer_t3_seconds=5, timer_t2_seconds=0.5):
         self.transceiver = transceiver
         self.timer_t1_seconds = timer_t1_seconds
+        self.timer_t2_seconds = timer_t2_seconds
         self.timer_t3_seconds = timer_t3_seconds
+        self.durations = {"t1": timer_t1_seconds,
+                          "t2": timer_t2_seconds,
+                          "t3": timer_t3_seconds}
         self._thread = threading.Thread(target=self._run, name="Timer control thread", daemon=True)
         self._kill = threading.Event()
         self._running = threading.Event()
         self.events = {"reset_t1":timer_reset_t1,
                        "cancel_t1": timer_cancel_t1,
                        "reset_t3": timer_reset_t3,
-                       "cancel_t3": timer_cancel_t3}
+                       "cancel_t3": timer_cancel_t3,
+                       "start_t2": timer_start_t2,
+                       "cancel_t2": timer_cancel_t2}
         self.handlers = {"t1": self.t1_timeout_handler,
+                         "t2": self.t2_timeout_handler,
                          "t3": self.t3_timeout_handler}
         self.timers = {}
+        self.event_threads = []
         self._kill = threading.Event()
         self._lock = threading.Lock()
 
@@ -33,7 +41,7 @@ class Timers:
                 if not self._running.is_set():
                     self._running.set()
         except Exception as e:
-            self.transceiver.logger.debug(f"Timers thread could not be started due to: {e}")
+            self.transceiver.logger.debug("Timers thread could not be started due to: %s", e)
 
     
     """ Thread loop that starts timers T1 and T3, then idles """
@@ -46,31 +54,72 @@ class Timers:
 
     """ 
     Timer T1 Timeout means singular lost I frame, that is not caught by sequence error 
-    Resolve by sending RR/RNR frame with P bit set to poll distant TNC 
+    Resolve by sending RR/RNR frame with P bit set to poll distant TNC.
+    During link setup and release the unanswered SABM or DISC is repeated instead
     """
     def t1_timeout_handler(self): #TODO Work on respnoses to this Poll
         
-        # with self.transceiver.lock:
-        # if self.transceiver.t1_try_count == self.transceiver.retries:
+        state = self.transceiver.get_state()
+        if state == 'DISC':
+            return # Left running from the released link
+        self.transceiver.metrics.count('t1_timeouts')
+
         if self.transceiver.get_t1_try_count() == self.transceiver.retries:
-            self.transceiver.logger.warning("Maximum T1 retries reached, something has gone seriously wrong!") #TODO 
+            if state == 'AWAITING_CONNECTION':
+                self.transceiver.logger.warning("Link setup failed, no answer to %d SABM frames", self.transceiver.retries)
+                self.transceiver.set_disconnected()
+            elif state == 'AWAITING_RELEASE':
+                self.transceiver.logger.debug("No answer to DISC, link released")
+                self.transceiver.set_disconnected()
+            else:
+                self.transceiver.logger.warning("Maximum T1 retries reached, link lost")
+                self.transceiver.set_disconnected()
+                self.transceiver.connect(only_if_pending=True) # Back up as soon as the remote answers again, unacknowledged frames are kept
             return
-        
+
+        self.transceiver.set_t1_try_count(self.transceiver.get_t1_try_count() + 1)
+        if state in ('AWAITING_CONNECTION', 'AWAITING_RELEASE'):
+            self.transceiver.logger.debug("T1 Timeout, repeating %s", 'link setup' if state == 'AWAITING_CONNECTION' else 'link release')
+            if state == 'AWAITING_RELEASE':
+                self.transceiver.queue_link_command('DISC')
+            else:
+                self.transceiver.queue_link_setup()
+            return
+
         self.transceiver.logger.debug("T1 Timeout")
-        with self.transceiver.lock:
-            self.transceiver.framequeue.insert(0,
-                                                {"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid],
-                                                "Type":'RNR' if self.transceiver.state == 'BUSY' else 'RR',
-                                                "Poll":True, 
-                                                "Payload": None, 
-                                                "Com":'COM'})
-        self.transceiver.set_t1_try_count(self.transceiver.get_t1_try_count() + 1) #TODO Check if this is correct
+        with self.transceiver.lock: # Frames received until the Final to this poll are handled in timer recovery
+            if self.transceiver.state == 'CONNECTED':
+                self.transceiver.state = 'TIMER_RECOVERY'
+        self.transceiver.queue_frame({"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid],
+                                      "Type":'RNR' if self.transceiver.get_own_busy() else 'RR',
+                                      "Poll":True, 
+                                      "Payload": None, 
+                                      "Com":'COM'}, 0)
         
         self.reset_timer("t1")
 
         return
 
 
+    """
+    Timer T2 delays acknowledgement of received I frames, so a burst is answered by a single RR
+    and acknowledgements can be piggybacked on outgoing I frames. Timeout means nothing carried
+    the acknowledgement yet, so send RR/RNR with the current N(R)
+    """
+    def t2_timeout_handler(self):
+
+        if not self.transceiver.get_ack_pending():
+            return
+
+        self.transceiver.logger.debug("T2 Timeout, sending delayed acknowledgement")
+        self.transceiver.queue_frame({"Dest":[self.transceiver.dest_addr, self.transceiver.dest_ssid],
+                                      "Type":'RNR' if self.transceiver.get_own_busy() else 'RR',
+                                      "Poll":False, 
+                                      "Payload": None, 
+                                      "Com":'COM'}, 0)
+        return
+
+
     """
     Timer T3 is used when no I frames are outstanding and T1 is not running.
     To check on link integrity, T3 timeout causes a RR/RNR frame poll.
@@ -82,34 +131,49 @@ class Timers:
     def setup_event_threads(self):
 
         for name, event in self.events.items():
-            threading.Thread(target=self.wait_for_event,
+            event_thread = threading.Thread(target=self.wait_for_event,
             args=[event, 
-            "t1" if name[-2:] == "t1" else "t3", #select appropriate timer
-            self.reset_timer if name[:-3] == "reset" else self.cancel_timer], #se;ect appropriate handler (reset or cancel)
+            name[-2:], #select appropriate timer
+            {"reset": self.reset_timer, "start": self.start_timer, "cancel": self.cancel_timer}[name[:-3]]], #select appropriate handler (reset, start or cancel)
             daemon=True,
-            name=f"WaitFor{name}").start()
-            self.transceiver.logger.debug(f"Started thread to wait for {name}, event: {event}")
+            name=f"WaitFor{name}")
+            event_thread.start()
+            self.event_threads.append(event_thread)
+            self.transceiver.logger.debug("Started thread to wait for %s, event: %s", name, event)
+
+
+    """ @return: list of the control thread, the event threads and the running timers, whose threads call the timeout handlers """
+    def get_threads(self) -> list:
+        return [self._thread] + list(self.event_threads) + [timer for timer in list(self.timers.values()) if timer.is_alive()]
 
 
     def cancel_timer(self, timer_name):
+        if timer_name == "t1" and self.transceiver.get_state_variable("vs") != self.transceiver.get_state_variable("va"):
+            return # Stale cancel overtaken by a newly sent I frame, T1 has to keep guarding it
         if timer_name in self.timers:
             self.timers[timer_name].cancel()
 
 
     def reset_timer(self, timer_name):
-        self.transceiver.logger.debug(f"(Re)setting timer {timer_name}")
+        self.transceiver.logger.debug("(Re)setting timer %s", timer_name)
         if timer_name in self.timers:
             self.timers[timer_name].cancel() #Cancel timer, if it exists
-        self.timers[timer_name] = threading.Timer(self.timer_t1_seconds if timer_name[-2:] == "t1" else self.timer_t3_seconds, 
+        self.timers[timer_name] = threading.Timer(self.durations[timer_name], 
                                                   self.handlers[timer_name], 
                                                   args=[]) 
         self.timers[timer_name].start()
+
+
+    def start_timer(self, timer_name):
+        if timer_name in self.timers and self.timers[timer_name].is_alive():
+            return # Already running, keep the original expiry
+        self.reset_timer(timer_name)
         
 
     def wait_for_event(self, event:threading.Event, timer_name:str, response_function) -> None: #TODO: Check if this is the way
         while True:
             event.wait()
+            event.clear() # Clear first, so a set during the response is not lost
             response_function(timer_name)
-            event.clear()
 
 
@@ -24,12 +24,15 @@
 import bitstring as bs
 import threading
 import socket
-import logging
 
 from .ax25_framer import Framer
 from .ax25_constants import PID
 from .ax25_connectors import Uplinker, Downlinker
 from .ax25_timers import Timers
+from .ax25_probe import Probe
+from .ax25_metrics import Metrics, Tracer
+from .ax25_logging import setup_logger
+from .ax25_profiler import Profiler
 
 
 
@@ -61,6 +64,21 @@ class Transceiver:
                 retries=10,
                 timer_t1_seconds=3,
                 timer_t3_seconds=10,
+                timer_t2_seconds=0.5,
+                rx_high_watermark=0,
+                rx_low_watermark=0,
+                tx_high_watermark=0,
+                tx_low_watermark=0,
+                xid=True,
+                digipeat=False,
+                digipeater_path=(),
+                monitor=False,
+                monitor_watchlist=(),
+                stats_interval=1.0,
+                tracing=False,
+                log_level='INFO',
+                async_logging=True,
+                log_rate_limit=5,
                 gr_block=None):
         
         self.src_addr = src_addr
@@ -75,12 +93,25 @@ class Transceiver:
             s_print("Window size k: %i bigger than avilable modulo %i. Reverting to default k=8" % (receive_window_k, self.modulo))
             self.receive_window_k = 7
         self.ack_timer = ack_timer
+        self.xid = xid # Negotiate N1, k, modulo and SREJ with XID ahead of every link setup
+        self.xid_pending = False
+        self.local_parameters = {'n1': self.information_field_length, 'k': self.receive_window_k, 'modulo': 8, 'srej': self.rej == 'SREJ', 'full_duplex': self.full_duplex} # What we support, the link runs at what both ends support. The framer builds one byte control fields only, so modulo 8
+        self.digipeat = digipeat # Repeat frames whose next unrepeated repeater address is ours
+        self.own_address_key = Framer.address_key(src_addr, src_ssid)
+        self.digipeater_keys = {self.own_address_key}
+        self.digipeater_path = [Framer.parse_address(repeater) if isinstance(repeater, str) else tuple(repeater) for repeater in digipeater_path] # Repeaters our frames are sent through, in order
+        if len(self.digipeater_path) > Framer.MAX_REPEATERS:
+            raise ValueError(f"Digipeater path {digipeater_path} has more than {Framer.MAX_REPEATERS} repeaters")
+        self.monitor = monitor # Publish every valid frame heard on Monitor out
+        self.monitor_keys = {Framer.address_key(*Framer.parse_address(watched)) if isinstance(watched, str) else Framer.address_key(*watched) for watched in monitor_watchlist} # Empty watches all
         self.retries = retries
         self.pid = bs.Bits(hex=PID)
         self.timer_reset_t1 = threading.Event()
         self.timer_cancel_t1 = threading.Event()
         self.timer_reset_t3 = threading.Event()
         self.timer_cancel_t3 = threading.Event()
+        self.timer_start_t2 = threading.Event()
+        self.timer_cancel_t2 = threading.Event()
         self.t1_try_count = 0
         self.t3_try_count = 0
 
@@ -88,24 +119,42 @@ class Transceiver:
         self.framer = Framer(self)
         self.uplinker = Uplinker(self, self.framer)
         self.downlinker = Downlinker(self, self.framer)
+        self.probe = Probe(self)
+        self.metrics = Metrics(self, stats_interval)
+        self.tracer = Tracer(self, tracing)
         self.gr_block = gr_block
 
-        self.timers = Timers(self, self.timer_reset_t1, self.timer_cancel_t1, self.timer_reset_t3, self.timer_cancel_t3, timer_t1_seconds, timer_t3_seconds)
+        self.timers = Timers(self, self.timer_reset_t1, self.timer_cancel_t1, self.timer_reset_t3, self.timer_cancel_t3, self.timer_start_t2, self.timer_cancel_t2, timer_t1_seconds, timer_t3_seconds, timer_t2_seconds)
 
         """ Setup helpers"""
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.framequeue = []
         self.frame_input_queue = []
-        self.lock = threading.Lock()
-        self.framequeue_not_empty = threading.Condition(self.lock)
-        self.frame_input_queue_not_empty = threading.Condition(self.lock)
-        self.frame_backlog = [0 for num in range(self.receive_window_k)]
+        self.lock = threading.RLock() # State variables and flags. Reentrant, the downlinker holds it for a whole state transition
+        self.tx_lock = threading.Lock() # Framequeue and frame backlog
+        self.rx_lock = threading.Lock() # Frame input queue
+        self.framequeue_not_empty = threading.Condition(self.tx_lock)
+        self.frame_input_queue_not_empty = threading.Condition(self.rx_lock)
+        self.frame_backlog = [None for num in range(self.modulo)] # Indexed by N(S), holds the last request and assembled frame sent with it
         self.ns_before_seqbreak = 0
         self.awaiting_final = False # Response to a Poll bit
+        self.ack_pending = False # Received I frames not yet acknowledged, see timer T2
+        self.frames_since_ack = 0
+        self.rx_high_watermark = rx_high_watermark # Bytes delivered on Payload out but not yet consumed downstream, at which we become BUSY. 0 disables
+        self.rx_low_watermark = min(rx_low_watermark, rx_high_watermark) # Bytes at which BUSY is cleared again
+        self.rx_buffered = 0
+        self.own_busy = False # Own receiver busy, reported as link state BUSY while connected
+        self.tx_high_watermark = tx_high_watermark # Payload bytes queued for sending at which the producer is asked to pause. 0 disables
+        self.tx_low_watermark = min(tx_low_watermark, tx_high_watermark) # Bytes at which the producer may resume
+        self.tx_queued = 0
+        self.tx_ready = True
+        self.pass_start = None # First frame received since the link was last down, see pass_setup_times
+        self.pass_acked = False
+        self.pass_setup_times = [] # Seconds from the first signal of each pass to its first acknowledged I frame
     
 
         """ Set internal variables """
-        self.state = 'DISC'
+        self.state = 'DISC' # Link state, see LINK_STATES. The link is set up with SABM once there is traffic or the remote connects
         self.rej_active = 0
         self.state_variables = {'vs': 0, 'vr': 0, 'va': 0}
 
@@ -117,24 +166,184 @@ class Transceiver:
 
         """ Setup logger """
 
-        self.logger = logging.getLogger(f"{__name__}.{self.src_addr}")
-        self.logger.setLevel(logging.DEBUG)
+        # Written by a listener thread unless async_logging is off, repeated warnings beyond log_rate_limit per 10 s are dropped
+        self.logger, self.fh = setup_logger(f"{__name__}.{self.src_addr}", f'ax25_{self.src_addr}.log', log_level, async_logging, log_rate_limit)
+        self.profiler = Profiler(self) # Switched on and off at runtime, see ax25_procedures.handle_profile
 
-        self.fh = logging.FileHandler(f'ax25_{self.src_addr}.log', mode='w')
-        self.fh.setLevel(logging.DEBUG)
-        self.logger.addHandler(self.fh)
+        """ Link addresses are known now, let the framer precompute its frame templates """
+        self.framer.set_link_addresses(self.src_addr, self.src_ssid, self.dest_addr, self.dest_ssid)
 
-        self.timing_logger = logging.getLogger(f"{__name__}.{self.src_addr}.timing")
-        self.timing_logger.setLevel(logging.DEBUG)
-        timing_file = logging.FileHandler(f'ax25_{self.src_addr}_timing.log', mode='w')
-        timing_file.setLevel(logging.DEBUG)
-        self.timing_logger.addHandler(timing_file)
+
+    """ Thread safe queue access, waking up the thread waiting on the queue """
+    def queue_frame(self, request:dict, position=None):
+        with self.framequeue_not_empty:
+            if position is None:
+                self.framequeue.append(request)
+            else:
+                self.framequeue.insert(position, request)
+            self.framequeue_not_empty.notify()
+
+    def queue_ui_frame(self, payload:bytes):
+        """ Connectionless UI frame, queued ahead of the I frames so it never waits for the window, the link or T1 """
+        request = {"Dest":[self.dest_addr, self.dest_ssid], "Type":'UI', "Poll":False, "Payload": self.pid.bytes + payload, "Com":'COM'}
+        with self.framequeue_not_empty:
+            position = next((position for position, queued in enumerate(self.framequeue) if queued["Type"] == 'I'), len(self.framequeue))
+            self.framequeue.insert(position, request)
+            self.framequeue_not_empty.notify()
+
+    def queue_input_frame(self, msg_pmt):
+        with self.frame_input_queue_not_empty:
+            self.frame_input_queue.append(msg_pmt)
+            self.frame_input_queue_not_empty.notify()
+
+    def wake_uplinker(self):
+        with self.framequeue_not_empty:
+            self.framequeue_not_empty.notify()
+
+
+    """ Link setup and release """
+    def connect(self, only_if_pending=False):
+        """
+        Starts link setup with SABM, T1 repeats it up to retries times. With only_if_pending this is skipped
+        when there is no I frame traffic waiting.
+        @return: True if link setup was started
+        """
+        if only_if_pending and not self.has_pending_traffic():
+            return False
+        with self.lock:
+            if self.state != 'DISC':
+                return False
+            self.state = 'AWAITING_CONNECTION'
+            self.t1_try_count = 0
+        self.logger.debug("Connecting")
+        self.queue_link_setup()
+        return True
+
+    def disconnect(self):
+        """ Starts link release with DISC. @return: True if the link was not already down or being released """
+        with self.lock:
+            if self.state in ('DISC', 'AWAITING_RELEASE'):
+                return False
+            self.state = 'AWAITING_RELEASE'
+            self.t1_try_count = 0
+        self.logger.debug("Disconnecting")
+        self.queue_link_command('DISC')
+        return True
+
+    def queue_link_setup(self):
+        """ Queues SABM(E) ahead of all other frames, preceded by the XID negotiating the link parameters, and (re)starts T1 for the UA """
+        requests = [{"Dest":[self.dest_addr, self.dest_ssid], "Type":'SABME' if self.modulo == 128 else 'SABM', "Poll":True, "Payload": None, "Com":'COM'}]
+        if self.xid:
+            with self.lock:
+                self.xid_pending = True
+            requests.insert(0, {"Dest":[self.dest_addr, self.dest_ssid], "Type":'XID', "Poll":True, "Payload": self.framer.build_xid_info(self.local_parameters), "Com":'COM'})
+        with self.framequeue_not_empty:
+            self.framequeue[0:0] = requests
+            self.framequeue_not_empty.notify()
+        self.timer_reset_t1.set()
+
+    def apply_xid_parameters(self, remote:dict):
+        """
+        Runs the link at the largest parameters both ends support, remote holds what the remote advertised.
+        Modulo is only changed while the link is down, the sequence numbers in flight depend on it
+        @return: dict of the negotiated parameters
+        """
+        with self.lock:
+            modulo = 8 # MODULO_128 advertised by the remote is not accepted, the framer builds one byte control fields only
+            if modulo != self.modulo and self.state in ('CONNECTED', 'TIMER_RECOVERY'):
+                modulo = self.modulo
+            negotiated = {'n1': min(self.local_parameters['n1'], remote.get('n1', self.local_parameters['n1'])),
+                          'k': min(self.local_parameters['k'], remote.get('k', self.local_parameters['k']), modulo - 1),
+                          'modulo': modulo,
+                          'srej': self.local_parameters['srej'] and remote.get('srej', False),
+                          'full_duplex': self.full_duplex}
+            self.information_field_length = negotiated['n1']
+            self.receive_window_k = negotiated['k']
+            self.rej = 'SREJ' if negotiated['srej'] else 'REJ'
+            if modulo != self.modulo:
+                self.modulo = modulo
+                self.frame_backlog = [None for num in range(self.modulo)]
+                self.framer.set_link_addresses(self.src_addr, self.src_ssid, self.dest_addr, self.dest_ssid) # Frame templates depend on modulo
+        if remote.get('full_duplex', self.full_duplex) != self.full_duplex:
+            self.logger.warning("Remote runs %s duplex, we don't", 'full' if remote['full_duplex'] else 'half')
+        self.logger.debug("XID negotiated: %s", negotiated)
+        return negotiated
+
+    def queue_link_command(self, frametype:str):
+        """ Queues SABM(E) or DISC with P set ahead of all other frames and (re)starts T1 for the response """
+        self.queue_frame({"Dest":[self.dest_addr, self.dest_ssid], "Type":frametype, "Poll":True, "Payload": None, "Com":'COM'}, 0)
+        self.timer_reset_t1.set()
+
+    def reset_link(self, response:dict=None):
+        """
+        Link (re)established, sequence numbers start over. I frames sent but not acknowledged on the old link are
+        queued again as new frames ahead of the rest, so no payload is lost and queued traffic resumes right away.
+        The response, e.g. the UA to the remote SABM, goes out first
+        """
+        with self.uplinker.framing_lock, self.framequeue_not_empty:
+            with self.lock:
+                stale = [request for request in self.framequeue if request.get("Frame") is not None] # Retransmissions queued on the old link
+                unacked = (self.state_variables['vs'] + len(stale) - self.state_variables['va'])%self.modulo
+                resend = [self.frame_backlog[(self.state_variables['va'] + offset)%self.modulo] for offset in range(unacked)]
+                resend = [{key: value for key, value in request.items() if key != "Frame"} for request in resend if request is not None]
+
+                queued = [request for request in self.framequeue if request.get("Frame") is None]
+                self.framequeue[:] = (([response] if response else []) + [request for request in queued if request["Type"] != 'I']
+                                      + [dict(request, Poll=False) for request in resend] + [request for request in queued if request["Type"] == 'I'])
+                self.frame_backlog = [None for num in range(self.modulo)]
+                self.state_variables = {'vs': 0, 'vr': 0, 'va': 0}
+                self.state = 'CONNECTED'
+                self.xid_pending = False
+                self.rej_active = 0
+                self.t1_try_count = 0
+                self.remote_busy = False
+                self.awaiting_final = False
+                self.ack_pending = False
+                self.frames_since_ack = 0
+                pause_producer = any([self.add_tx_queued(len(request["Payload"])) for request in resend]) # Released again when they are framed anew
+            self.framequeue_not_empty.notify()
+
+        self.timer_cancel_t1.set()
+        self.timer_cancel_t2.set()
+        if resend:
+            self.logger.debug("Link reset, %d unacknowledged I frames queued again", len(resend))
+        if pause_producer:
+            self.uplinker.send_flow_control()
+
+    def set_disconnected(self):
+        """ Link released or lost, the next frame received starts a new pass """
+        with self.lock:
+            self.state = 'DISC'
+            self.t1_try_count = 0
+            self.awaiting_final = False
+            self.pass_start = None
+
+    def has_pending_traffic(self):
+        """ @return: True if I frames are queued or sent but not acknowledged """
+        with self.tx_lock:
+            if any(request["Type"] == 'I' for request in self.framequeue):
+                return True
+        with self.lock:
+            return self.state_variables['vs'] != self.state_variables['va']
+
+    def get_link_up(self):
+        """ @return: True if I frames may be sent """
+        with self.lock:
+            return self.state in ('CONNECTED', 'TIMER_RECOVERY')
+
+    def get_pass_setup_times(self):
+        with self.lock:
+            return list(self.pass_setup_times)
+
+    def get_stats(self):
+        """ @return: dict of the current link metrics, see Metrics.snapshot """
+        return self.metrics.snapshot()
 
 
     """ Thread safe getters and setters for different transceiver variables """
     def get_state(self):
         with self.lock:
-            return self.state
+            return 'BUSY' if self.own_busy and self.state == 'CONNECTED' else self.state
     
     def get_state_variable(self, key):
         with self.lock:
@@ -160,6 +369,8 @@ class Transceiver:
     def set_remote_busy(self, state:bool):
         with self.lock:
             self.remote_busy = state
+        if not state:
+            self.wake_uplinker() # I frames may have been held back for the remote
     
     def get_remote_busy(self):
         with self.lock:
@@ -189,6 +400,90 @@ class Transceiver:
         with self.lock:
             self.t1_try_count = count
 
+    def get_awaiting_final(self):
+        with self.lock:
+            return self.awaiting_final
+
+    def set_awaiting_final(self, state:bool):
+        with self.lock:
+            self.awaiting_final = state
+
+    def get_ack_pending(self):
+        with self.lock:
+            return self.ack_pending
+
+    def set_ack_pending(self):
+        """ Marks a received I frame as unacknowledged, returns the number of frames awaiting acknowledgement """
+        with self.lock:
+            self.ack_pending = True
+            self.frames_since_ack += 1
+            return self.frames_since_ack
+
+    def clear_ack_pending(self):
+        """ Called before a frame carrying N(R) is built, the acknowledgement is piggybacked on it """
+        with self.lock:
+            self.ack_pending = False
+            self.frames_since_ack = 0
+        self.timer_cancel_t2.set()
+
+    def add_rx_buffered(self, nbytes:int):
+        """ Accounts a payload handed to Payload out, returns True if this crossed the high watermark and we just became BUSY """
+        with self.lock:
+            if not self.rx_high_watermark:
+                return False
+            self.rx_buffered += nbytes
+            if self.own_busy or self.rx_buffered < self.rx_high_watermark:
+                return False
+            self.own_busy = True
+            return True
+
+    def release_rx_buffered(self, nbytes:int):
+        """ Accounts payload bytes consumed downstream, returns True if this drained the buffer to the low watermark and BUSY was cleared """
+        with self.lock:
+            self.rx_buffered = max(self.rx_buffered - nbytes, 0)
+            if not self.own_busy or self.rx_buffered > self.rx_low_watermark:
+                return False
+            self.own_busy = False
+            return True
+
+    def get_own_busy(self):
+        with self.lock:
+            return self.own_busy
+
+    def get_rx_buffered(self):
+        with self.lock:
+            return self.rx_buffered
+
+    def add_tx_queued(self, nbytes:int):
+        """ Accounts a payload queued for sending, returns True if this crossed the high watermark and the producer should pause """
+        with self.lock:
+            if not self.tx_high_watermark:
+                return False
+            self.tx_queued += nbytes
+            if not self.tx_ready or self.tx_queued < self.tx_high_watermark:
+                return False
+            self.tx_ready = False
+            return True
+
+    def release_tx_queued(self, nbytes:int):
+        """ Accounts a queued payload framed for the first time, returns True if the queue drained to the low watermark and the producer may resume """
+        with self.lock:
+            if not self.tx_high_watermark:
+                return False
+            self.tx_queued = max(self.tx_queued - nbytes, 0)
+            if self.tx_ready or self.tx_queued > self.tx_low_watermark:
+                return False
+            self.tx_ready = True
+            return True
+
+    def get_tx_queued(self):
+        with self.lock:
+            return self.tx_queued
+
+    def get_tx_ready(self):
+        with self.lock:
+            return self.tx_ready
+
     def get_t3_try_count(self):
         with self.lock:
             return self.t3_try_count
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+"""
+Microbenchmarks for the framer, deframer, CRC, NRZI and frame extractor on synthetic data. The blocks' work functions
+are called directly, no flowgraph or radio is needed. Results can be written as JSON and compared against an earlier run
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+import bitstring as bs
+import numpy as np
+try:
+    from gnuradio.hwu.ax25_transceiver import Transceiver
+    from gnuradio.hwu.ax25_extract_frame import ax25_extract_frame
+    from gnuradio.hwu.nrzi_encode_packed import nrzi_encode_packed
+    from gnuradio.hwu.nrzi_decode_packed import nrzi_decode_packed
+except ImportError:
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    sys.path.append(os.path.join(dirname, "bindings"))
+    from gnuradio.hwu.ax25_transceiver import Transceiver
+    from gnuradio.hwu.ax25_extract_frame import ax25_extract_frame
+    from gnuradio.hwu.nrzi_encode_packed import nrzi_encode_packed
+    from gnuradio.hwu.nrzi_decode_packed import nrzi_decode_packed
+
+
+def unstuff(frame):
+    """ Received form of a frame built by the framer, flags removed and bitstuffing undone """
+    bits = bs.BitArray(bytes=frame)
+    bits = bits[8:bits.find('0b01111110', start=8)[0]] # Frames are padded to full bytes after the closing flag
+    bits.replace('0b111110', '0b11111')
+    return bits.tobytes()
+
+
+def build_cases(payload_lens, stream_len):
+    """ @return: list of (name, callable, bytes processed per call) """
+
+    # Logs and profile files of the transceiver go to a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="hwu_bench_"))
+    trx = Transceiver('HWUGND', 1, 'HWUSAT', 1, log_level='WARNING', stats_interval=0)
+    remote = Transceiver('HWUSAT', 1, 'HWUGND', 1, log_level='WARNING', stats_interval=0)
+    relay = Transceiver('RELAY', 3, 'HWUGND', 1, log_level='WARNING', stats_interval=0, digipeat=True)
+    via_relay = Transceiver('HWUSAT', 2, 'HWUGND', 1, log_level='WARNING', stats_interval=0, digipeater_path=['RELAY-3'])
+    framer = trx.framer
+    frame = lambda frametype, payload, trx=trx: trx.framer.frame(frametype, trx.src_addr, trx.src_ssid, trx.dest_addr, trx.dest_ssid, trx.pid, payload, 'COM')
+
+    cases = []
+    for length in payload_lens:
+        payload = bytes(n % 256 for n in range(length))
+        payload_crc = framer.calc_checksum(payload)
+        staged = framer.stage_payload(trx.pid, payload)
+        received_i = unstuff(remote.framer.frame('I', 'HWUSAT', 1, 'HWUGND', 1, remote.pid, payload, 'COM'))
+        repeat = unstuff(via_relay.framer.frame('UI', 'HWUSAT', 2, 'HWUGND', 1, via_relay.pid, payload, 'COM'))
+
+        cases += [(f"frame_I_{length}", lambda payload=payload: frame('I', payload), length),
+                  (f"frame_I_precomputed_{length}", lambda payload=payload, payload_crc=payload_crc, staged=staged: framer.frame('I', trx.src_addr, trx.src_ssid, trx.dest_addr, trx.dest_ssid, trx.pid, payload, 'COM', trx.modulo, False, payload_crc, staged), length),
+                  (f"frame_UI_{length}", lambda payload=payload: frame('UI', payload), length),
+                  (f"deframe_I_{length}", lambda received_i=received_i: framer.deframe(received_i), len(received_i)),
+                  (f"calc_checksum_{length}", lambda payload=payload: framer.calc_checksum(payload), length),
+                  (f"digipeat_{length}", lambda repeat=repeat: relay.framer.digipeat(repeat, relay.digipeater_keys), len(repeat)),
+                  (f"monitor_{length}", lambda repeat=repeat: relay.framer.monitor(repeat, set()), len(repeat))]
+
+    received_rr = unstuff(remote.framer.frame('RR', 'HWUSAT', 1, 'HWUGND', 1, remote.pid, None, 'RES'))
+    cases += [("frame_S_RR", lambda: frame('RR', None), 0),
+              ("frame_U_SABM", lambda: frame('SABM', None), 0),
+              ("frame_U_SABM_uncached", lambda: framer.frame('SABM', 'HWUGND', 1, 'OTHER', 2, trx.pid, None, 'COM'), 0), # Other link, no template
+              ("deframe_S_RR", lambda: framer.deframe(received_rr), len(received_rr)),
+              ("combine_checksum_2048", lambda: framer.combine_checksum(0x1234, 0x5678, 2048), 0)]
+
+    # Synthetic bitstreams for the stream blocks, random bits and back to back frames with flags
+    bitstream = np.random.default_rng(0).integers(0, 256, stream_len, dtype=np.uint8)
+    output = np.zeros(stream_len, dtype=np.uint8)
+    encoder = nrzi_encode_packed()
+    decoder = nrzi_decode_packed()
+    framestream = b"".join(frame('UI', bytes(n % 256 for n in range(256))) for _ in range(max(1, stream_len//300)))
+    framestream = np.frombuffer(framestream, dtype=np.uint8)
+    extractor = ax25_extract_frame()
+
+    cases += [(f"nrzi_encode_work_{stream_len}", lambda: encoder.work([bitstream], [output]), stream_len),
+              (f"nrzi_decode_work_{stream_len}", lambda: decoder.work([bitstream], [output]), stream_len),
+              (f"extract_frame_work_{len(framestream)}", lambda: extractor.work([framestream], []), len(framestream))]
+    return cases
+
+
+def run_case(function, repeat, min_time):
+    """ @return: tuple (calls per run, seconds per call), best of repeat runs of at least min_time each """
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return number, min(timer.repeat(repeat=repeat, number=number))/number
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_file, threshold):
+    """ Prints the change against a baseline run. @return: names of the cases slower by more than threshold """
+    with open(baseline_file) as baseline:
+        baseline = {result["name"]: result for result in json.load(baseline)["results"]}
+
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None:
+            continue
+        change = before["ops_per_s"]/result["ops_per_s"] - 1 # Positive when slower
+        regressed = change > threshold
+        if regressed:
+            regressions.append(result["name"])
+        print(f"{result['name']:32s} {before['ops_per_s']:12.0f} -> {result['ops_per_s']:12.0f} ops/s {-change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--payload-len", type=int, nargs="+", default=[16, 256, 2048])
+    parser.add_argument("--stream-len", type=int, default=4096, help="bytes per work() call of the stream blocks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the fastest counts")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per run at least")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown against --compare counted as regression")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    results = []
+    for name, function, nbytes in build_cases(args.payload_len, args.stream_len):
+        if args.filter not in name:
+            continue
+        number, seconds = run_case(function, args.repeat, args.min_time)
+        result = {"name": name, "ops_per_s": 1/seconds, "bytes_per_s": nbytes/seconds, "us_per_op": seconds*1e6, "bytes_per_op": nbytes, "calls_per_run": number}
+        results.append(result)
+        print(f"{name:32s} {result['ops_per_s']:12.0f} ops/s {result['bytes_per_s']/1e6:10.3f} MB/s {result['us_per_op']:12.2f} us/op")
+
+    if output:
+        with open(output, 'w') as results_file:
+            json.dump({"commit": git_commit(),
+                       "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "numpy": np.__version__,
+                       "results": results}, results_file, indent=1)
+
+    if baseline and compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
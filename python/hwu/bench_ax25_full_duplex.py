@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+""" Bidirectional goodput benchmark for ax25_procedures in full and half duplex, two TNCs connected back to back through a loopback channel """
+
+import argparse
+import random
+import time
+import bitstring as bs
+import pmt
+from gnuradio import gr, blocks
+try:
+    from gnuradio.hwu import ax25_procedures
+except ImportError:
+    import os
+    import sys
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    sys.path.append(os.path.join(dirname, "bindings"))
+    from gnuradio.hwu import ax25_procedures
+
+
+class loopback_channel(gr.basic_block):
+    """
+    Message loopback between the Frame out and Frame in ports of two TNCs, drops frames at the given rate.
+    Frame out carries flag delimited, bitstuffed frames, a whole burst in one message in half duplex. Frame in takes one
+    received frame per message. The channel splits on every flag and undoes the bitstuffing in between, as
+    ax25_extract_frame does on the real bit path
+    """
+    FLAG = '0b01111110'
+
+    def __init__(self, loss=0.0):
+        gr.basic_block.__init__(self,
+            name="AX25_loopback_channel",
+            in_sig=None,
+            out_sig=None)
+        self.loss = loss
+        self.message_port_register_in(pmt.intern('in'))
+        self.set_msg_handler(pmt.intern('in'), self.handle_in)
+        self.message_port_register_out(pmt.intern('out'))
+
+    def handle_in(self, msg_pmt):
+        bits = bs.BitArray(bytes=bytes(pmt.u8vector_elements(pmt.cdr(msg_pmt))))
+        flags = list(bits.findall(self.FLAG))
+        for start, end in zip(flags, flags[1:]):
+            frame_bits = bits[start + 8:end]
+            if len(frame_bits) < 8: # Back to back flags, or the padding to full bytes after a closing flag
+                continue
+            if random.random() < self.loss:
+                continue
+            frame_bits.replace('0b111110', '0b11111')
+            frame = frame_bits.tobytes()
+            self.message_port_pub(pmt.intern('out'), pmt.cons(pmt.car(msg_pmt), pmt.init_u8vector(len(frame), list(frame))))
+
+
+def run_once(payloads, payload_len, full_duplex, loss, timeout):
+
+    tb = gr.top_block()
+    ground = ax25_procedures('GNDGND', 1, 'SATSAT', 1, full_duplex=full_duplex, rej='REJ')
+    satellite = ax25_procedures('SATSAT', 1, 'GNDGND', 1, full_duplex=full_duplex, rej='REJ')
+    uplink = loopback_channel(loss)
+    downlink = loopback_channel(loss)
+    ground_sink = blocks.message_debug()
+    satellite_sink = blocks.message_debug()
+
+    tb.msg_connect(ground, 'Frame out', uplink, 'in')
+    tb.msg_connect(uplink, 'out', satellite, 'Frame in')
+    tb.msg_connect(satellite, 'Frame out', downlink, 'in')
+    tb.msg_connect(downlink, 'out', ground, 'Frame in')
+    tb.msg_connect(ground, 'Payload out', ground_sink, 'store')
+    tb.msg_connect(satellite, 'Payload out', satellite_sink, 'store')
+
+    tb.start()
+    start_time = time.perf_counter()
+    for _ in range(payloads):
+        for tnc in (ground, satellite):
+            tnc.to_basic_block()._post(pmt.intern('Payload in'), pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(payload_len, [n % 256 for n in range(payload_len)])))
+
+    while ground_sink.num_messages() + satellite_sink.num_messages() < 2*payloads and time.perf_counter() - start_time < timeout:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start_time
+    delivered = ground_sink.num_messages() + satellite_sink.num_messages()
+
+    tb.stop()
+    tb.wait()
+    return delivered, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--payloads", type=int, default=200, help="payloads sent in each direction")
+    parser.add_argument("--payload-len", type=int, nargs="+", default=[64, 256, 2048])
+    parser.add_argument("--loss", type=float, nargs="+", default=[0.0, 0.05])
+    parser.add_argument("--duplex", nargs="+", choices=["full", "half"], default=["full", "half"])
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    for duplex in args.duplex:
+        for payload_len in args.payload_len:
+            for loss in args.loss:
+                delivered, elapsed = run_once(args.payloads, payload_len, duplex == "full", loss, args.timeout)
+                print(f"{duplex:4s} duplex payload_len={payload_len:5d} loss={loss:4.2f}: {delivered:5d}/{2*args.payloads} delivered in {elapsed:6.2f}s, "
+                      f"{delivered*payload_len*8/elapsed/1e3:10.1f} kbit/s bidirectional goodput")
+
+
+if __name__ == '__main__':
+    main()
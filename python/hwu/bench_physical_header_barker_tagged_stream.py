@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+""" Throughput benchmark for the physical_header_barker_tagged_stream block """
+
+import argparse
+import time
+from gnuradio import gr, blocks
+try:
+    from gnuradio.hwu import physical_header_barker_tagged_stream
+except ImportError:
+    import os
+    import sys
+    dirname, filename = os.path.split(os.path.abspath(__file__))
+    sys.path.append(os.path.join(dirname, "bindings"))
+    from gnuradio.hwu import physical_header_barker_tagged_stream
+
+
+def run_once(packets, packet_len, barker_len, add_tail, preamble_repeats):
+
+    tb = gr.top_block()
+    src = blocks.vector_source_b([n % 256 for n in range(packet_len)], True, 1, [])
+    head = blocks.head(gr.sizeof_char, packets*packet_len)
+    to_tagged = blocks.stream_to_tagged_stream(gr.sizeof_char, 1, packet_len, "packet_len")
+    add_header = physical_header_barker_tagged_stream(barker_len, add_tail, "packet_len", preamble_repeats)
+    sink = blocks.null_sink(gr.sizeof_char)
+    tb.connect(src, head, to_tagged, add_header, sink)
+
+    start_time = time.perf_counter()
+    tb.run()
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--packet-len", type=int, nargs="+", default=[16, 256, 2048])
+    parser.add_argument("--barker-len", type=int, default=11)
+    parser.add_argument("--preamble-repeats", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    for packet_len in args.packet_len:
+        for repeats in args.preamble_repeats:
+            for add_tail in (False, True):
+                elapsed = run_once(args.packets, packet_len, args.barker_len, add_tail, repeats)
+                print(f"packet_len={packet_len:5d} repeats={repeats:2d} tail={add_tail!s:5}: "
+                      f"{args.packets/elapsed:12.0f} packets/s, {args.packets*packet_len/elapsed/1e6:8.2f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
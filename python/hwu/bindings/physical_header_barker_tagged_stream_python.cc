@@ -14,7 +14,7 @@
 /* BINDTOOL_GEN_AUTOMATIC(0)                                                       */
 /* BINDTOOL_USE_PYGCCXML(0)                                                        */
 /* BINDTOOL_HEADER_FILE(physical_header_barker_tagged_stream.h)                                        */
-/* BINDTOOL_HEADER_FILE_HASH(ece25f3ef365ce8c15eb9d9cb4af4a62)                     */
+/* BINDTOOL_HEADER_FILE_HASH(a4d4aea6022ab243e75c2c2352fcf496)                     */
 /***********************************************************************************/
 
 #include <pybind11/complex.h>
@@ -40,6 +40,7 @@ void bind_physical_header_barker_tagged_stream(py::module& m)
            py::arg("barker_len"),
            py::arg("add_tail"),
            py::arg("lengthtagname"),
+           py::arg("preamble_repeats") = 1,
            D(physical_header_barker_tagged_stream,make)
         )
         
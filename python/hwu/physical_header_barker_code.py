@@ -7,7 +7,7 @@
 #
 
 
-# import numpy
+import numpy
 import pmt
 from gnuradio import gr
 
@@ -17,13 +17,13 @@ class physical_header_barker_code(gr.basic_block):
     These help with synchronisation of the timing recovery and enhance sync performance
     """
 
-    BARKER_CODES = {2: [2],   #[1,0],
-                    3: [6],   #[1,1,0],
-                    4: [13],  #[1,1,0,1],
-                    5: [29],  #[1,1,1,0,1],
-                    7: [114], #[1,1,1,0,0,1,0],
-                    11: [7,18], #[1,1,1,0,0,0,1,0,0,1,0],
-                    13: [31,53]#[1,1,1,1,1,0,0,1,1,0,1,0,1]
+    BARKER_CODES = {2: (2,),   #[1,0],
+                    3: (6,),   #[1,1,0],
+                    4: (13,),  #[1,1,0,1],
+                    5: (29,),  #[1,1,1,0,1],
+                    7: (114,), #[1,1,1,0,0,1,0],
+                    11: (7,18), #[1,1,1,0,0,0,1,0,0,1,0],
+                    13: (31,53)#[1,1,1,1,1,0,0,1,1,0,1,0,1]
                     }
     
     def __init__(self, barker_len, add_tail):
@@ -33,7 +33,10 @@ class physical_header_barker_code(gr.basic_block):
             out_sig=[])
         
 
-        self.barker_sequence = self.BARKER_CODES[barker_len]
+        """ Precompute read-only header and tail templates, these are never modified per frame """
+        self.header = numpy.array(self.BARKER_CODES[barker_len], dtype=numpy.uint8)
+        self.header.flags.writeable = False
+        self.tail = self.header if add_tail else numpy.empty(0, dtype=numpy.uint8)
         self.add_tail = add_tail
         self.message_port_register_in(pmt.intern('Frame in'))
         self.set_msg_handler(pmt.intern('Frame in'), self.handle_frame_in)
@@ -42,20 +45,16 @@ class physical_header_barker_code(gr.basic_block):
     
     def handle_frame_in(self, msg_pmt):
 
-        data = self.barker_sequence
-        data.extend(pmt.u8vector_elements(pmt.cdr(msg_pmt)))
-        if self.add_tail:
-            data.extend(self.barker_sequence)
+        payload = pmt.u8vector_elements(pmt.cdr(msg_pmt))
+        header_len = len(self.header)
+        payload_end = header_len + len(payload)
 
-        self.message_port_pub(pmt.intern('Frame out'), pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(data),data))) ## Overwrites Metadata
-        data = []
-
-        return
+        """ Assemble header, payload and tail in a single preallocated buffer """
+        data = numpy.empty(payload_end + len(self.tail), dtype=numpy.uint8)
+        data[:header_len] = self.header
+        data[header_len:payload_end] = payload
+        data[payload_end:] = self.tail
 
+        self.message_port_pub(pmt.intern('Frame out'), pmt.cons(pmt.car(msg_pmt), pmt.init_u8vector(len(data), data)))
 
-    # def work(self, input_items, output_items):
-    #     in0 = input_items[0]
-    #     out = output_items[0]
-    #     # <+signal processing here+>
-    #     out[:] = in0
-    #     return len(output_items[0])
+        return
@@ -6,9 +6,64 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 #
 
+import os
+import time
+import logging
+import tempfile
+import pmt
+import bitstring as bs
 from gnuradio import gr, gr_unittest
 # from gnuradio import blocks
 from gnuradio.hwu import ax25_procedures
+from gnuradio.hwu.ax25_logging import RateLimitFilter
+from gnuradio.hwu.ax25_constants import S_FRAMES, U_FRAMES, BIT_REVERSED_BYTES
+
+
+def unstuff(frame):
+    """ Received form of a frame built by the framer, flags removed and bitstuffing undone """
+    bits = bs.BitArray(bytes=frame)
+    bits = bits[8:bits.find('0b01111110', start=8)[0]] # Frames are padded to full bytes after the closing flag
+    bits.replace('0b111110', '0b11111')
+    return bits.tobytes()
+
+def split_frames(burst):
+    """ Received form of every frame in a Frame out message, a half duplex burst carries several """
+    bits = bs.BitArray(bytes=burst)
+    flags = list(bits.findall('0b01111110'))
+    frames = []
+    for start, end in zip(flags, flags[1:]):
+        frame = bits[start + 8:end]
+        if len(frame) < 8: # Padding to full bytes after a closing flag
+            continue
+        frame.replace('0b111110', '0b11111')
+        frames.append(frame.tobytes())
+    return frames
+
+def reference_checksum(data):
+    """ CRC-16/KERMIT bit by bit """
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+    return crc
+
+def reference_addresses(src_addr, src_ssid, dest_addr, dest_ssid, command_response):
+    """ Destination and source address fields, C bits set as command or response """
+    dest = bs.Bits(bytes=dest_addr.ljust(6).encode()) + bs.Bits(bin='0b111' if command_response == 'COM' else '0b011') + bs.Bits(uint=dest_ssid, length=4) + bs.Bits(bin='0b0')
+    src = bs.Bits(bytes=src_addr.ljust(6).encode()) + bs.Bits(bin='0b011' if command_response == 'COM' else '0b111') + bs.Bits(uint=src_ssid, length=4) + bs.Bits(bin='0b1')
+    return (dest + src).bytes
+
+def reference_frame(header, info=b''):
+    """ Frame as the original bitstring framer built it: bytes mirrored to LSB first, FCS as is, stuffed between the flags """
+    flag = bs.Bits(bin='0b01111110')
+    bits = bs.BitArray(flag)
+    for byte in header + info:
+        bits += bs.Bits(uint=byte, length=8)[::-1]
+    bits += bs.Bits(uint=reference_checksum(header + info), length=16) + flag
+    bits.replace('0b11111', '0b111110', 8, -8)
+    return bits.tobytes()
+
 
 class qa_ax25_procedures(gr_unittest.TestCase):
 
@@ -30,6 +85,350 @@ class qa_ax25_procedures(gr_unittest.TestCase):
         self.tb.run()
         # check data
 
+    def test_002_rx_busy_watermarks(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", rx_high_watermark=100, rx_low_watermark=20)
+        transceiver = procedures.transceiver
+        transceiver.set_state('CONNECTED') # BUSY is only reported on an established link
+
+        self.assertFalse(transceiver.add_rx_buffered(60))
+        self.assertTrue(transceiver.add_rx_buffered(60))
+        self.assertEqual(transceiver.get_state(), 'BUSY')
+        self.assertFalse(transceiver.add_rx_buffered(60)) # Already BUSY
+
+        procedures.handle_payload_consumed(pmt.from_long(100))
+        self.assertEqual(transceiver.get_state(), 'BUSY') # 80 bytes left, above low watermark
+
+        procedures.handle_payload_consumed(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(60, [0]*60)))
+        self.assertEqual(transceiver.get_rx_buffered(), 20)
+        self.assertEqual(transceiver.get_state(), 'CONNECTED')
+
+    def test_003_tx_queue_watermarks(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", tx_high_watermark=100, tx_low_watermark=20)
+        transceiver = procedures.transceiver
+
+        self.assertFalse(transceiver.add_tx_queued(60))
+        self.assertTrue(transceiver.add_tx_queued(60)) # Producer is paused
+        self.assertFalse(transceiver.get_tx_ready())
+        self.assertFalse(transceiver.release_tx_queued(60))
+        self.assertTrue(transceiver.release_tx_queued(60)) # Producer may resume
+        self.assertTrue(transceiver.get_tx_ready())
+        self.assertEqual(transceiver.get_tx_queued(), 0)
+
+    def test_004_link_setup(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", xid=False) # XID ahead of SABM is covered by test_013
+        transceiver = procedures.transceiver
+        self.assertEqual(transceiver.get_state(), 'DISC')
+
+        # Unacknowledged frames of the old link are queued again when the link comes up
+        transceiver.set_state('CONNECTED')
+        request = {"Dest":['HWUSAT', 1], "Type":'I', "Poll":False, "Payload": b'ab', "Com":'COM'}
+        transceiver.frame_backlog[0] = dict(request, Frame=b'\x7e')
+        transceiver.set_state_variable('vs', 1)
+        transceiver.set_disconnected()
+        transceiver.uplinker._kill.set() # Keep the queue as it is
+        time.sleep(0.5)
+
+        self.assertTrue(transceiver.connect())
+        self.assertFalse(transceiver.connect()) # Already connecting
+        self.assertEqual(transceiver.get_state(), 'AWAITING_CONNECTION')
+
+        transceiver.reset_link()
+        self.assertEqual(transceiver.get_state(), 'CONNECTED')
+        self.assertEqual(transceiver.get_state_variable('vs'), 0)
+        self.assertEqual([frame["Type"] for frame in transceiver.framequeue], ['SABM', 'I'])
+        self.assertNotIn("Frame", transceiver.framequeue[1])
+
+    def test_005_xid_negotiation(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="SREJ", information_field_length=2048, receive_window_k=7)
+        transceiver = procedures.transceiver
+        framer = transceiver.framer
+
+        remote = {'n1': 256, 'k': 4, 'modulo': 8, 'srej': False, 'full_duplex': False}
+        self.assertEqual(framer.parse_xid_info(framer.build_xid_info(remote)), remote)
+
+        negotiated = transceiver.apply_xid_parameters(remote)
+        self.assertEqual((negotiated['n1'], negotiated['k'], negotiated['srej']), (256, 4, False))
+        self.assertEqual(transceiver.information_field_length, 256)
+        self.assertEqual(transceiver.rej, 'REJ')
+        self.assertEqual(transceiver.apply_xid_parameters(dict(remote, modulo=128))['modulo'], 8) # Control fields are one byte only
+        self.assertEqual(framer.parse_xid_info(framer.build_xid_info(dict(remote, modulo=128)))['modulo'], 8)
+
+        with self.assertRaises(ValueError):
+            framer.parse_xid_info(b'\x00\x00\x00\x00')
+
+    def test_006_probe_echo(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ")
+        probe = procedures.transceiver.probe
+        probe.run_id = 7
+
+        probe.handle_echo(probe.HEADER.pack(7, 0, 10.0), 10.25)
+        probe.handle_echo(probe.HEADER.pack(6, 1, 10.0), 10.5) # Left over from an earlier run
+        probe.handle_echo(probe.HEADER.pack(7, 0, 10.0), 11.0) # Duplicate
+        self.assertEqual(probe.echoes, {0: (0.25, 10.25)})
+
+    def test_007_digipeat(self):
+
+        sender = ax25_procedures(src_addr='HWUSAT', dest_addr='HWUGND', digipeater_path='RELAY-3').transceiver
+        relay = ax25_procedures(src_addr='RELAY', src_ssid=3, dest_addr='HWUGND', digipeat=True).transceiver
+        receiver = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT').transceiver
+
+        frame = unstuff(sender.framer.frame('UI', 'HWUSAT', 1, 'HWUGND', 1, sender.pid, sender.pid.bytes + b'beacon', 'COM'))
+        self.assertEqual(receiver.framer.deframe(frame)['Type'], 'ERROR') # Not repeated yet
+
+        repeated = unstuff(relay.framer.digipeat(frame, relay.digipeater_keys))
+        self.assertIsNone(relay.framer.digipeat(repeated, relay.digipeater_keys))
+        data = receiver.framer.deframe(repeated)
+        self.assertEqual((data['Type'], data['Pid-Data']), ('UI', sender.pid.bytes + b'beacon'))
+
+        monitor = ax25_procedures(src_addr='NOC', dest_addr='HWUSAT', monitor=True, monitor_watchlist='RELAY-3').transceiver
+        record = monitor.framer.monitor(repeated, monitor.monitor_keys)
+        self.assertEqual((record['dest'], record['src'], record['path'], record['type']), ('HWUGND-1', 'HWUSAT-1', ['RELAY-3*'], 'UI'))
+        self.assertEqual((record['pid'], record['info']), (sender.pid.bytes[0], b'beacon'))
+        self.assertIsNone(monitor.framer.monitor(repeated, {monitor.framer.address_key('RELAY', 4)}))
+
+    def test_008_metrics(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", stats_interval=0)
+        metrics = procedures.transceiver.metrics
+
+        for seconds in (0.00005, 0.0003, 0.0003, 0.002):
+            metrics.observe('handler', seconds)
+        metrics.count('crc_errors')
+        latency = metrics.latency('handler')
+        self.assertEqual((latency['count'], latency['max'], latency['p50'], latency['p99']), (4, 0.002, 0.0004, 0.002))
+
+        stats = procedures.transceiver.get_stats()
+        self.assertEqual(stats['counters'], {'crc_errors': 1})
+        self.assertEqual((stats['state'], stats['outstanding'], stats['framequeue']), ('DISC', 0, 0))
+
+    def test_009_log_rate_limit(self):
+
+        log_filter = RateLimitFilter(burst=2, interval=10.0)
+        def record(created, level=logging.WARNING):
+            entry = logging.LogRecord('hwu', level, __file__, 0, "Frame %d dropped", (1,), None)
+            entry.created = created
+            return entry
+
+        self.assertEqual([log_filter.filter(record(time)) for time in (0, 1, 2, 3)], [True, True, False, False])
+        self.assertTrue(log_filter.filter(record(5, logging.DEBUG))) # Below the limited level
+        late = record(11)
+        self.assertTrue(log_filter.filter(late))
+        self.assertEqual(late.getMessage(), "Frame 1 dropped (2 similar messages suppressed)")
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", stats_interval=0, log_rate_limit=3)
+        self.assertEqual([log_filter.burst for log_filter in procedures.transceiver.logger.filters], [3])
+
+    def test_010_tracing(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", stats_interval=0, tracing=True)
+        tracer = procedures.transceiver.tracer
+
+        trace = tracer.stamp()
+        trace["enqueued"] = 100.0
+        tracer.sent([trace], 100.5)
+        tracer.sent([trace], 103.5) # Retransmission
+        tracer.acked([trace], 104.0)
+        tracer.acked([trace], 105.0) # Acknowledged again after a link reset, not counted twice
+
+        self.assertEqual(tracer.get_records(), [{"id": trace["id"], "enqueue_to_send": 0.5, "send_to_ack": 3.5, "enqueue_to_ack": 4.0, "retransmissions": 1}])
+        self.assertEqual(procedures.transceiver.metrics.latency('send_to_ack')['count'], 1)
+
+    def test_011_profiler(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", stats_interval=0)
+        profiler = procedures.transceiver.profiler
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'profile.txt')
+            procedures.handle_profile(pmt.to_pmt({'enable': True, 'interval': 0.001, 'filename': filename}))
+            time.sleep(0.2)
+            self.assertFalse(profiler.start()) # Already running
+            procedures.handle_profile(pmt.intern('stop'))
+            with open(filename) as profile:
+                text = profile.read()
+
+        self.assertIn("Uplinker:", text)
+        self.assertIn("Downlinker:", text)
+        self.assertIsNone(profiler.stop())
+
+    def test_012_monitor_digipeat(self):
+
+        sender = ax25_procedures(src_addr='HWUSAT', dest_addr='HWUGND', digipeater_path='RELAY-3', stats_interval=0).transceiver
+        relay = ax25_procedures(src_addr='RELAY', src_ssid=3, dest_addr='HWUGND', digipeat=True, monitor=True, stats_interval=0).transceiver
+        sent = []
+        relay.uplinker.send = sent.append
+
+        frame = unstuff(sender.framer.frame('UI', 'HWUSAT', 1, 'HWUGND', 1, sender.pid, sender.pid.bytes + b'beacon', 'COM'))
+        relay.queue_input_frame(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(frame), list(frame))))
+        time.sleep(0.5)
+
+        self.assertEqual(sent, [relay.framer.digipeat(frame, relay.digipeater_keys)]) # Monitor mode does not stop the relay for frames to other stations
+
+    def test_013_xid_link_setup(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", information_field_length=256, stats_interval=0)
+        transceiver = procedures.transceiver
+        transceiver.uplinker._kill.set() # Keep the queue as it is
+        time.sleep(0.5)
+
+        self.assertTrue(transceiver.connect())
+        self.assertEqual([frame["Type"] for frame in transceiver.framequeue], ['XID', 'SABM'])
+        self.assertEqual(transceiver.framer.parse_xid_info(transceiver.framequeue[0]["Payload"])['n1'], 256)
+
+        procedures.handle_payload_in(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(300, [0]*300))) # Above N1
+        self.assertEqual(len(transceiver.framequeue), 2)
+        self.assertEqual(transceiver.get_stats()['counters'], {'payloads_dropped': 1})
+
+    def test_014_framer_reference(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', src_ssid=1, dest_addr='HWUSAT', dest_ssid=2, rej="REJ", stats_interval=0, xid=False)
+        transceiver = procedures.transceiver
+        framer = transceiver.framer
+        pid = transceiver.pid
+        payload = b'\xff\x7e\x1f\xf8' + bytes(range(64)) # Runs of ones within and across bytes
+        link = ('HWUGND', 1, 'HWUSAT', 2)
+        other = ('HWUGND', 1, 'OTHER', 3) # Not the configured link, built without templates
+
+        self.assertEqual(reference_checksum(b'123456789'), 0x2189) # CRC-16/KERMIT check value
+        self.assertEqual(framer.calc_checksum(b'123456789'), 0x2189)
+        header = reference_addresses(*link, 'COM') + bytes([0]) + pid.bytes
+        self.assertEqual(framer.combine_checksum(framer.calc_checksum(header), framer.calc_checksum(payload), len(payload)), framer.calc_checksum(header + payload))
+
+        transceiver.set_state_variable('vr', 5)
+        for addresses in (link, other):
+            for frametype in S_FRAMES:
+                c_field = 5 << 5 | 1 << 4 | int(S_FRAMES[frametype], 2)
+                self.assertEqual(framer.frame(frametype, *addresses, pid, None, 'RES', 8, True), reference_frame(reference_addresses(*addresses, 'RES') + bytes([c_field])))
+            for frametype in ('SABM', 'UA', 'DISC', 'DM'):
+                c_field = int(U_FRAMES[frametype][0], 2) << 5 | 1 << 4 | int(U_FRAMES[frametype][1], 2)
+                self.assertEqual(framer.frame(frametype, *addresses, pid, None, 'COM', 8, True), reference_frame(reference_addresses(*addresses, 'COM') + bytes([c_field])))
+            c_field = int(U_FRAMES['UI'][0], 2) << 5 | int(U_FRAMES['UI'][1], 2)
+            self.assertEqual(framer.frame('UI', *addresses, pid, pid.bytes + payload, 'COM'), reference_frame(reference_addresses(*addresses, 'COM') + bytes([c_field]), pid.bytes + payload))
+
+        transceiver.set_state_variable('vr', 3)
+        transceiver.set_state_variable('vs', 2)
+        sent = reference_frame(reference_addresses(*link, 'COM') + bytes([3 << 5 | 2 << 1]) + pid.bytes, payload)
+        self.assertEqual(framer.frame('I', *link, pid, payload, 'COM'), sent)
+        self.assertEqual(transceiver.get_state_variable('vs'), 3)
+        transceiver.set_state_variable('vs', 2)
+        self.assertEqual(framer.frame('I', *link, pid, payload, 'COM', 8, False, framer.calc_checksum(payload), framer.stage_payload(pid, payload)), sent)
+
+        transceiver.set_state_variable('vr', 6)
+        resent = reference_frame(reference_addresses(*link, 'COM') + bytes([6 << 5 | 1 << 4 | 2 << 1]) + pid.bytes, payload)
+        self.assertEqual(framer.reframe(transceiver.frame_backlog[2]["Frame"], True), resent)
+        self.assertEqual(framer.reframe(transceiver.frame_backlog[2]["Frame"], True, framer.calc_checksum(payload)), resent)
+
+        received = reference_frame(reference_addresses('HWUSAT', 2, 'HWUGND', 1, 'COM') + bytes([4 << 5 | 1 << 4 | 6 << 1]) + pid.bytes, payload)
+        data = framer.deframe(unstuff(received))
+        self.assertEqual((data['Type'], data['Poll'], data['Nr'], data['Ns'], data['Com'], data['Pid-Data']), ('I', True, 4, 6, 'COM', pid.bytes + payload))
+
+    def test_015_delayed_ack(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", stats_interval=0, xid=False) # Half duplex, T2 of 0.5s
+        transceiver = procedures.transceiver
+        remote = ax25_procedures(src_addr='HWUSAT', dest_addr='HWUGND', rej="REJ", stats_interval=0, xid=False).transceiver
+        sent = []
+        transceiver.uplinker.send = sent.append
+        transceiver.set_state('CONNECTED')
+
+        def receive(count):
+            for _ in range(count):
+                frame = unstuff(remote.framer.frame('I', 'HWUSAT', 1, 'HWUGND', 1, remote.pid, b'data', 'COM'))
+                transceiver.queue_input_frame(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(frame), list(frame))))
+        def acknowledgements():
+            return [(data['Type'], data['Nr']) for burst in sent for data in map(remote.framer.deframe, split_frames(burst))]
+
+        receive(3) # Within T2, answered by a single RR
+        time.sleep(1.0)
+        self.assertEqual(acknowledgements(), [('RR', 3)])
+
+        sent.clear()
+        receive(1)
+        time.sleep(0.1)
+        procedures.handle_payload_in(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(4, list(b'data'))))
+        time.sleep(1.0)
+        self.assertEqual(acknowledgements(), [('I', 4)]) # N(R) piggybacked, no RR once T2 runs out
+
+    def test_016_half_duplex_burst(self):
+
+        ground_block = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", receive_window_k=3, stats_interval=0, xid=False)
+        ground = ground_block.transceiver
+        satellite = ax25_procedures(src_addr='HWUSAT', dest_addr='HWUGND', rej="REJ", receive_window_k=3, stats_interval=0, xid=False).transceiver
+        key_ups = [] # (sender, [(I frame, P/F) of every frame in the burst])
+
+        def channel(sender, receiver):
+            def send(burst):
+                frames = split_frames(burst)
+                c_fields = [BIT_REVERSED_BYTES[frame[14]] for frame in frames] # Received bytes are LSB first
+                key_ups.append((sender.src_addr, [(not c_field & 0b1, bool(c_field & 0b10000)) for c_field in c_fields]))
+                for frame in frames:
+                    receiver.queue_input_frame(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(frame), list(frame))))
+            return send
+        ground.uplinker.send = channel(ground, satellite)
+        satellite.uplinker.send = channel(satellite, ground)
+
+        ground.connect()
+        deadline = time.time() + 20.0
+        while ground.get_state() != 'CONNECTED' and time.time() < deadline:
+            time.sleep(0.05)
+        with ground.uplinker.framing_lock: # All five queued before the first burst is collected
+            for _ in range(5):
+                ground_block.handle_payload_in(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(4, list(b'data'))))
+        while ground.get_state_variable('va') != 5 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(ground.get_state_variable('va'), 5)
+
+        bursts = [(position, [poll for i_frame, poll in frames if i_frame]) for position, (sender, frames) in enumerate(key_ups) if sender == 'HWUGND']
+        bursts = [(position, polls) for position, polls in bursts if polls]
+        self.assertEqual([len(polls) for position, polls in bursts], [3, 2]) # Limited by the window k
+        for position, polls in bursts:
+            self.assertEqual(polls, [False]*(len(polls) - 1) + [True]) # P on the last I frame only
+            sender, frames = key_ups[position + 1] # Channel left to the remote until its Final
+            self.assertEqual(sender, 'HWUSAT')
+            self.assertTrue(any(final for i_frame, final in frames))
+        self.assertFalse(ground.get_awaiting_final())
+
+    def test_017_ui_frames(self):
+
+        procedures = ax25_procedures(src_addr='HWUGND', dest_addr='HWUSAT', rej="REJ", stats_interval=0)
+        transceiver = procedures.transceiver
+        remote = ax25_procedures(src_addr='HWUSAT', dest_addr='HWUGND', rej="REJ", stats_interval=0).transceiver
+        sent = []
+        published = []
+        transceiver.uplinker.send = sent.append
+        procedures.message_port_pub = lambda port, msg: published.append((port, bytes(pmt.u8vector_elements(pmt.cdr(msg)))))
+
+        # Received UI frame, delivered on UI out without link setup or acknowledgement
+        frame = unstuff(remote.framer.frame('UI', 'HWUSAT', 1, 'HWUGND', 1, remote.pid, remote.pid.bytes + b'beacon', 'COM')) # PID is part of a UI payload
+        procedures.handle_frame_in(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(frame), list(frame))))
+        time.sleep(1.0)
+        self.assertEqual(published, [(pmt.intern('UI out'), b'beacon')])
+        self.assertEqual(sent, [])
+        self.assertEqual(transceiver.get_state(), 'DISC')
+        self.assertEqual(transceiver.get_stats()['counters'].get('received_UI'), 1)
+
+        # PDU tagged 'ui' on Payload in, sent as a UI frame on the disconnected link
+        meta = pmt.dict_add(pmt.make_dict(), pmt.intern('ui'), pmt.PMT_T)
+        procedures.handle_payload_in(pmt.cons(meta, pmt.init_u8vector(9, list(b'telemetry'))))
+        deadline = time.time() + 5.0
+        while not sent and time.time() < deadline:
+            time.sleep(0.05)
+        frames = [remote.framer.deframe(frame) for burst in sent for frame in split_frames(burst)]
+        self.assertEqual([(data['Type'], data['Pid-Data'][1:]) for data in frames], [('UI', b'telemetry')])
+        self.assertEqual(transceiver.get_state(), 'DISC')
+
+        # UI payload over N1, dropped and counted
+        length = transceiver.information_field_length + 1
+        procedures.handle_payload_in(pmt.cons(meta, pmt.init_u8vector(length, [0]*length)))
+        self.assertEqual(transceiver.get_stats()['counters'].get('payloads_dropped'), 1)
+        time.sleep(0.5)
+        self.assertEqual(len(sent), 1)
+
 
 if __name__ == '__main__':
     gr_unittest.run(qa_ax25_procedures)
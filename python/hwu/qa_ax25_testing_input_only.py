@@ -60,6 +60,32 @@ class qa_ax25_testing_input_only(gr_unittest.TestCase):
         assert len(msg) == len(expected_frame)
         assert msg == expected_frame
 
+    def test_002_default_arguments(self):
+
+        data_in = [1,2,3]
+        # GNDGND to SATSAT in half duplex, the only I frame of the burst is sent with P set. Bytes as sent, LSB first and bitstuffed
+        expected_frame = [0x7e, 0xca, 0x82, 0x2a, 0xca, 0x82, 0x2a, 0x47, 0xd1, 0x39, 0x11, 0x71, 0x39, 0x11, 0x63, 0x04, 0x07, 0xc0, 0x10, 0x30, 0x0e, 0xb9, 0x9f, 0x80]
+
+        hwu_ax25_testing_input_only_0 = ax25_testing_input_only()
+        blocks_message_strobe_0 = blocks.message_strobe(pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(3,data_in) ), 1000)
+        message_sink = blocks.message_debug(True)
+
+        self.tb.msg_connect((blocks_message_strobe_0, 'strobe'), (hwu_ax25_testing_input_only_0, 'Payload in'))
+        self.tb.msg_connect((hwu_ax25_testing_input_only_0, 'Frame out'), (message_sink, 'store'))
+
+        self.tb.start()
+        deadline = time.time() + 5.0
+        while time.time() < deadline:
+            if message_sink.num_messages() > 0:
+                break
+            time.sleep(0.05)
+        self.tb.stop()
+        self.tb.wait()
+        assert message_sink.num_messages() > 0
+
+        msg = pmt.u8vector_elements(pmt.cdr(message_sink.get_message(0)))
+        assert msg == expected_frame
+
 
 if __name__ == '__main__':
     gr_unittest.run(qa_ax25_testing_input_only)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2025 Julian Birk.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+
+import pmt
+from gnuradio import gr, gr_unittest
+from gnuradio import blocks
+from physical_header_barker_code import physical_header_barker_code
+
+class qa_physical_header_barker_code(gr_unittest.TestCase):
+
+    def setUp(self):
+        self.tb = gr.top_block()
+
+    def tearDown(self):
+        self.tb = None
+
+    def test_instance(self):
+        instance = physical_header_barker_code(11, False)
+
+    def test_001_header_does_not_grow(self):
+
+        add_header = physical_header_barker_code(11, True)
+        sink = blocks.message_debug()
+        self.tb.msg_connect(add_header, 'Frame out', sink, 'store')
+
+        meta = pmt.dict_add(pmt.make_dict(), pmt.intern("packet_num"), pmt.from_long(3))
+        for _ in range(3):
+            add_header.to_basic_block()._post(pmt.intern('Frame in'), pmt.cons(meta, pmt.init_u8vector(3, [1,2,3])))
+        add_header.to_basic_block()._post(pmt.intern("system"), pmt.cons(pmt.intern("done"), pmt.from_long(1)))
+
+        self.tb.start()
+        self.tb.wait()
+
+        self.assertEqual(sink.num_messages(), 3)
+        for i in range(3):
+            msg = sink.get_message(i)
+            self.assertEqual(list(pmt.u8vector_elements(pmt.cdr(msg))), [7,18,1,2,3,7,18])
+            self.assertTrue(pmt.equal(pmt.car(msg), meta))
+
+
+if __name__ == '__main__':
+    gr_unittest.run(qa_physical_header_barker_code)